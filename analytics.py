@@ -0,0 +1,260 @@
+"""
+Feedback analytics.
+
+Rating trends per employee, per team and per skill, served as JSON for the
+dashboard charts:
+
+* ``/analytics/team``            the manager's team (``scope=organisation``
+                                 for everyone below them), with percentiles
+                                 across employees and one slope per employee
+* ``/analytics/skills``          the same team, per skill
+* ``/analytics/employee/<id>``   one employee
+
+The database does the heavy lifting with one ``GROUP BY month`` query per
+response (feedback count and rating sum per series and month). The result
+is pivoted into a series x month matrix and rolling averages, percentiles
+and least-squares trend slopes (rating change per month) are computed for
+all series at once with pandas/NumPy, which are imported on first use.
+
+Results are cached per process under a stamp of the feedback table and the
+page versions, and the responses support conditional GET.
+"""
+import warnings
+from flask import Blueprint, abort, g, jsonify, request
+from flask_login import login_required, current_user
+from sqlalchemy import func, select
+from app import db
+from models import Employee, Feedback
+from hierarchy import subtree_employee_ids
+from permissions import authorize, feedback_subjects
+from http_cache import conditional
+from stats import page_versions
+from ttl_cache import TTLCache
+from utils import require_manager, int_arg
+
+analytics_bp = Blueprint('analytics', __name__, url_prefix='/analytics')
+
+# Months returned by default and at most, ending with the latest month with feedback
+DEFAULT_MONTHS = 12
+MAX_MONTHS = 60
+
+# Months in the rolling average
+DEFAULT_WINDOW = 3
+
+# Computed responses; the key includes the data stamp, so the TTL only bounds
+# how long superseded entries take memory
+cache = TTLCache(maxsize=512, ttl=600)
+
+
+def configure(app):
+    """Apply ANALYTICS_CACHE_SIZE / ANALYTICS_CACHE_TTL from the app config"""
+    cache.maxsize = app.config.get('ANALYTICS_CACHE_SIZE', cache.maxsize)
+    cache.ttl = app.config.get('ANALYTICS_CACHE_TTL', cache.ttl)
+
+
+def data_stamp():
+    """Changes whenever feedback is added, edited or deleted, or employees change"""
+    if 'analytics_stamp' not in g:
+        count, updated = db.session.execute(select(func.count(Feedback.id), func.max(Feedback.updated_at))).one()
+        g.analytics_stamp = (count, updated, page_versions())
+    return g.analytics_stamp
+
+
+def monthly_ratings(series_column, employee_filter):
+    """(series, month, feedback count, rating sum) rows for the employees matched by the filter"""
+    return db.session.execute(
+        select(series_column, Feedback.month, func.count(Feedback.id), func.sum(Feedback.rating))
+        .join(Employee, Employee.id == Feedback.employee_id)
+        .where(employee_filter)
+        .group_by(series_column, Feedback.month)
+    ).all()
+
+
+def trends(rows, months=DEFAULT_MONTHS, window=DEFAULT_WINDOW):
+    """Trend statistics of monthly_ratings() rows, for every series at once.
+
+    Returns the month labels and, per series, the monthly average rating and
+    feedback count, the rolling average and the slope, plus the same for all
+    series combined and percentiles of the series' averages per month.
+    Months without feedback are null.
+    """
+    # Deferred like the importer's: pandas is only needed for these responses
+    import numpy as np
+    import pandas as pd
+
+    if not rows:
+        return {'months': [], 'series': {}, 'overall': None}
+
+    frame = pd.DataFrame(rows, columns=['series', 'month', 'count', 'rating_sum'])
+    frame['month'] = pd.to_datetime(frame['month'], format='%Y-%m', errors='coerce').dt.to_period('M')
+    frame = frame.dropna(subset=['month'])
+    if frame.empty:
+        return {'months': [], 'series': {}, 'overall': None}
+    last = frame['month'].max()
+    labels = pd.period_range(max(frame['month'].min(), last - (months - 1)), last, freq='M')
+
+    # series x month matrices; months without feedback count 0
+    table = frame.groupby(['series', 'month'])[['count', 'rating_sum']].sum().unstack('month')
+    counts = table['count'].reindex(columns=labels).fillna(0).to_numpy(dtype=float)
+    sums = table['rating_sum'].reindex(columns=labels).fillna(0).to_numpy(dtype=float)
+    # Series without feedback in the selected months are left out
+    active = counts.sum(axis=1) > 0
+    counts, sums = counts[active], sums[active]
+    keys = [key for key, keep in zip(table.index.tolist(), active) if keep]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        averages = np.where(counts > 0, sums / counts, np.nan)
+        rolling = _rolling_average(sums, counts, window)
+        slopes = _slopes(averages)
+        overall_counts = counts.sum(axis=0)
+        overall_sums = sums.sum(axis=0)
+        overall_averages = np.where(overall_counts > 0, overall_sums / overall_counts, np.nan)
+        overall_rolling = _rolling_average(overall_sums[None, :], overall_counts[None, :], window)[0]
+        overall_slope = _slopes(overall_averages[None, :])[0]
+    with warnings.catch_warnings():
+        # Months without feedback for any series have no percentiles
+        warnings.simplefilter('ignore', RuntimeWarning)
+        percentiles = np.nanpercentile(averages, [25, 50, 75], axis=0)
+
+    series = {}
+    for i, key in enumerate(keys):
+        series[key] = {
+            'average': _json_values(averages[i]),
+            'count': counts[i].astype(int).tolist(),
+            'rolling_average': _json_values(rolling[i]),
+            'slope': _json_value(slopes[i], 4),
+        }
+    return {
+        'months': [str(label) for label in labels],
+        'series': series,
+        'overall': {
+            'average': _json_values(overall_averages),
+            'count': overall_counts.astype(int).tolist(),
+            'rolling_average': _json_values(overall_rolling),
+            'slope': _json_value(overall_slope, 4),
+            'p25': _json_values(percentiles[0]),
+            'median': _json_values(percentiles[1]),
+            'p75': _json_values(percentiles[2]),
+        },
+    }
+
+
+def _rolling_average(sums, counts, window):
+    """Rating average over the last ``window`` months, weighted by feedback count"""
+    import numpy as np
+
+    def rolling_sum(values):
+        total = np.cumsum(values, axis=1)
+        total[:, window:] -= total[:, :-window].copy()
+        return total
+
+    rolled_counts = rolling_sum(counts)
+    return np.where(rolled_counts > 0, rolling_sum(sums) / rolled_counts, np.nan)
+
+
+def _slopes(averages):
+    """Least-squares slope of each row against the month index, skipping empty months"""
+    import numpy as np
+
+    present = ~np.isnan(averages)
+    x = np.broadcast_to(np.arange(averages.shape[1], dtype=float), averages.shape)
+    n = present.sum(axis=1)
+    y = np.where(present, averages, 0.0)
+    x_mean = np.where(present, x, 0.0).sum(axis=1) / n
+    y_mean = y.sum(axis=1) / n
+    dx = np.where(present, x - x_mean[:, None], 0.0)
+    dy = np.where(present, y - y_mean[:, None], 0.0)
+    variance = (dx * dx).sum(axis=1)
+    return np.where((n >= 2) & (variance > 0), (dx * dy).sum(axis=1) / variance, np.nan)
+
+
+def _json_value(value, digits=2):
+    return None if value != value else round(float(value), digits)
+
+
+def _json_values(values):
+    return [_json_value(value) for value in values]
+
+
+def _team_filter(scope):
+    if scope == 'organisation':
+        return Employee.id.in_(subtree_employee_ids(current_user.id))
+    return Employee.manager_id == current_user.id
+
+
+def _query_args():
+    months = min(max(int_arg(request.args, 'months', DEFAULT_MONTHS), 1), MAX_MONTHS)
+    window = min(max(int_arg(request.args, 'window', DEFAULT_WINDOW), 1), months)
+    scope = 'organisation' if request.args.get('scope') == 'organisation' else 'team'
+    return months, window, scope
+
+
+def _cached(key, compute):
+    key = (key, current_user.get_id(), _query_args(), data_stamp())
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.put(key, result)
+    return result
+
+
+def _stamps(**kwargs):
+    return [data_stamp(), _query_args()]
+
+
+@analytics_bp.route('/team')
+@login_required
+@require_manager
+@conditional(_stamps)
+def team_trends():
+    """Monthly rating trend of the team, with per-employee averages and slopes"""
+    def compute():
+        months, window, scope = _query_args()
+        result = trends(monthly_ratings(Employee.id, _team_filter(scope)), months, window)
+        names = dict(db.session.execute(
+            select(Employee.id, Employee.full_name).where(Employee.id.in_(list(result['series'])))
+        ).all())
+        result['employees'] = sorted(
+            ({'id': employee_id, 'name': names.get(employee_id), **values}
+             for employee_id, values in result.pop('series').items()),
+            key=lambda employee: employee['name'] or ''
+        )
+        return result
+
+    return jsonify(_cached('team', compute))
+
+
+@analytics_bp.route('/skills')
+@login_required
+@require_manager
+@conditional(_stamps)
+def skill_trends():
+    """Monthly rating trend of the team per skill"""
+    def compute():
+        months, window, scope = _query_args()
+        result = trends(monthly_ratings(Employee.skill, _team_filter(scope)), months, window)
+        result['skills'] = [{'skill': skill, **values} for skill, values in sorted(result.pop('series').items())]
+        return result
+
+    return jsonify(_cached('skills', compute))
+
+
+@analytics_bp.route('/employee/<int:employee_id>')
+@login_required
+@conditional(_stamps)
+def employee_trends(employee_id):
+    """Monthly rating trend of one employee"""
+    employee, allowed = authorize(Employee, employee_id, feedback_subjects(employee_id))
+    if not allowed:
+        abort(403)
+
+    def compute():
+        months, window, _ = _query_args()
+        result = trends(monthly_ratings(Employee.id, Employee.id == employee.id), months, window)
+        result.pop('series')
+        overall = result.pop('overall') or {}
+        for percentile in ('p25', 'median', 'p75'):
+            overall.pop(percentile, None)
+        return dict(result, **overall)
+
+    return jsonify(_cached(('employee', employee_id), compute))
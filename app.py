@@ -1,72 +1,196 @@
 import os
 import logging
+import click
 from flask import Flask, render_template
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from flask_login import LoginManager
 from werkzeug.middleware.proxy_fix import ProxyFix
+import db_profiles
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": db_profiles.RoutingSession})
 login_manager = LoginManager()
 
-# Create the Flask application
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
-
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
-    "DATABASE_URL", "sqlite:///employee_management.db"
-)
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-
-# Initialize extensions with the app
-db.init_app(app)
-login_manager.init_app(app)
-login_manager.login_view = 'auth.login'
-login_manager.login_message_category = 'info'
 
-# Handle error pages
-@app.errorhandler(404)
-def page_not_found(e):
-    return render_template('errors/404.html'), 404
-
-@app.errorhandler(500)
-def internal_server_error(e):
-    return render_template('errors/500.html'), 500
-
-# Setup login manager user loader
-@login_manager.user_loader
-def load_user(user_id):
-    from models import User  # Import here to avoid circular imports
-    return User.query.get(int(user_id))
+def create_app():
+    """Create and configure the application.
 
-# Create all tables and import routes
-with app.app_context():
-    # Import models (moved to inside app context to avoid circular imports)
+    Does not touch the database: run ``flask --app main init-db`` to create
+    or upgrade the schema, or set DB_INIT_ON_START=1 to do it on startup.
+    """
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+    
+    # Configure the database
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+        "DATABASE_URL", "sqlite:///employee_management.db"
+    )
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["DB_INIT_ON_START"] = os.environ.get("DB_INIT_ON_START", "0") == "1"
+    
+    # Connection pooling, SQLite pragmas and the optional read replica, selected
+    # with DB_PROFILE (see db_profiles.py)
+    db_profiles.configure(app)
+    
+    # Background jobs (imports, exports, documentation builds)
+    app.config["JOB_WORKERS"] = int(os.environ.get("JOB_WORKERS", "2"))
+    app.config["JOB_TIMEOUT"] = int(os.environ.get("JOB_TIMEOUT", "3600"))
+    app.config["JOB_RESULT_TTL"] = int(os.environ.get("JOB_RESULT_TTL", "86400"))
+    app.config["DOCS_WARM_UP"] = os.environ.get("DOCS_WARM_UP", "0") == "1"
+    
+    # Requests slower than this are logged with their slowest SQL statements (0 disables)
+    app.config["SLOW_REQUEST_THRESHOLD_MS"] = int(os.environ.get("SLOW_REQUEST_THRESHOLD_MS", "1000"))
+    
+    # Logged-in user identity cache (per worker process)
+    app.config["IDENTITY_CACHE_SIZE"] = int(os.environ.get("IDENTITY_CACHE_SIZE", "1024"))
+    app.config["IDENTITY_CACHE_TTL"] = int(os.environ.get("IDENTITY_CACHE_TTL", "60"))
+    
+    # Rendered template fragments: objects kept in memory, and an optional
+    # directory shared by all worker processes
+    app.config["FRAGMENT_CACHE_SIZE"] = int(os.environ.get("FRAGMENT_CACHE_SIZE", "5000"))
+    app.config["FRAGMENT_CACHE_DIR"] = os.environ.get("FRAGMENT_CACHE_DIR")
+    
+    # Computed rating trends served to the dashboard charts (per worker process)
+    app.config["ANALYTICS_CACHE_SIZE"] = int(os.environ.get("ANALYTICS_CACHE_SIZE", "512"))
+    app.config["ANALYTICS_CACHE_TTL"] = int(os.environ.get("ANALYTICS_CACHE_TTL", "600"))
+    
+    # Initialize extensions with the app
+    db.init_app(app)
+    login_manager.init_app(app)
+    login_manager.login_view = 'auth.login'
+    login_manager.login_message_category = 'info'
+    
+    app.register_error_handler(404, page_not_found)
+    app.register_error_handler(500, internal_server_error)
+    
+    # Import models (here rather than at the top to avoid circular imports);
+    # dashboard counters are maintained by session events registered in stats
     import models
+    import stats
     
-    # Create database tables
-    db.create_all()
+    import identity
+    identity.configure(app)
+    
+    # {% cache %} tag for expensive template fragments
+    import fragment_cache
+    fragment_cache.init_app(app)
+    
+    import analytics
+    analytics.configure(app)
     
     # Import and register blueprints
     from auth import auth_bp
     from employee import employee_bp
     from feedback import feedback_bp
     from docs import docs_bp
+    from jobs import jobs_bp
+    from search import search_bp
+    from hierarchy import hierarchy_bp
+    from analytics import analytics_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(employee_bp)
     app.register_blueprint(feedback_bp)
     app.register_blueprint(docs_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(hierarchy_bp)
+    app.register_blueprint(analytics_bp)
+    
+    # Per-request timing and SQL instrumentation, served at /metrics
+    import metrics
+    metrics.init_app(app)
+    
+    for command in (init_db_command, create_indexes_command, rebuild_stats_command,
+                    rebuild_search_index_command, merge_duplicate_feedback_command):
+        app.cli.add_command(command)
+    
+    if app.config["DB_INIT_ON_START"]:
+        with app.app_context():
+            init_db()
     
     logger.info("Application initialized successfully")
+    return app
+
+
+# Handle error pages
+def page_not_found(e):
+    return render_template('errors/404.html'), 404
+
+def internal_server_error(e):
+    return render_template('errors/500.html'), 500
+
+# Setup login manager user loader
+@login_manager.user_loader
+def load_user(user_id):
+    from identity import load_identity  # Import here to avoid circular imports
+    return load_identity(int(user_id))
+
+
+def init_db():
+    """Create missing tables, columns and indexes, and the search index"""
+    import models
+    import search
+    import stats
+    
+    db.create_all()
+    models.add_missing_columns()
+    models.create_missing_indexes()
+    # Dashboard counters of databases that predate them
+    stats.ensure_initialized()
+    # Full-text search tables (SQLite FTS5) or indexes (PostgreSQL)
+    return search.ensure_search_index()
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create or upgrade the database schema"""
+    backend = init_db()
+    print(f"Database schema is up to date (search: {backend})")
+
+
+@click.command('create-indexes')
+@with_appcontext
+def create_indexes_command():
+    """Create declared indexes missing from an existing database"""
+    from models import create_missing_indexes
+    created = create_missing_indexes()
+    print(f"Created indexes: {', '.join(created)}" if created else "All indexes already exist")
+
+
+@click.command('rebuild-stats')
+@with_appcontext
+def rebuild_stats_command():
+    """Recompute the dashboard counters from the employee and feedback tables"""
+    from stats import rebuild
+    rebuild()
+    print("Dashboard counters rebuilt")
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Re-index all employees and feedback for full-text search"""
+    from search import rebuild_search_index
+    backend = rebuild_search_index()
+    print(f"Search index rebuilt ({backend})")
+
+
+@click.command('merge-duplicate-feedback')
+@with_appcontext
+def merge_duplicate_feedback_command():
+    """Keep the newest feedback per employee, month and provider, then add the unique index"""
+    from models import create_missing_indexes
+    from stats import merge_duplicate_feedback
+    removed = merge_duplicate_feedback()
+    print(f"Removed {removed} duplicate feedback entries")
+    created = create_missing_indexes()
+    print(f"Created indexes: {', '.join(created)}" if created else "All indexes already exist")
@@ -2,7 +2,8 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash
 from app import db
-from models import User, Employee
+from models import User
+from identity import current_employee
 import logging
 
 logger = logging.getLogger(__name__)
@@ -40,7 +41,7 @@ def logout():
 @login_required
 def profile():
     # Find employee record related to this user if it exists
-    employee = Employee.query.filter_by(user_id=current_user.id).first()
+    employee = current_employee()
     return render_template('profile.html', employee=employee)
 
 # Admin function to create initial users
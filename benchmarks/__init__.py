@@ -0,0 +1,7 @@
+"""
+Performance benchmarks for the EMS application.
+
+Each module can be run directly, e.g. ``python -m benchmarks.index_benchmark``.
+Benchmarks use their own database (see ``--database``) and never touch the
+application's configured database.
+"""
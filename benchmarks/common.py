@@ -0,0 +1,35 @@
+"""
+Shared helpers for the benchmarks: application setup and statistics.
+"""
+import logging
+import os
+import sys
+
+
+def setup_app(database_url, fresh=True):
+    """Create the application against a benchmark database and its schema.
+
+    With ``fresh`` an existing SQLite file is removed first.
+    """
+    if fresh and database_url.startswith('sqlite:///'):
+        path = database_url[len('sqlite:///'):]
+        if os.path.exists(path):
+            os.remove(path)
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import create_app, db, init_db
+    app = create_app()
+    with app.app_context():
+        init_db()
+
+    # The application logs at DEBUG; keep benchmark output readable
+    logging.getLogger().setLevel(logging.WARNING)
+    app.config['SLOW_REQUEST_THRESHOLD_MS'] = 0
+    return app, db
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
@@ -0,0 +1,158 @@
+"""
+Concurrency benchmark
+
+Generates a synthetic organisation, then serves the application with
+gunicorn once per worker configuration and has many concurrent clients
+request the dashboard, the employee list API and the feedback list for a
+fixed time. Reports throughput and latency per configuration, e.g. the
+default one-request-at-a-time sync workers against opt-in threaded workers:
+
+    python -m benchmarks.concurrency --clients 200 --duration 20
+
+Each configuration is "worker_class:workers:threads".
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from benchmarks.common import setup_app, percentile
+
+DEFAULT_DATABASE = 'sqlite:////tmp/ems_concurrency_benchmark.db'
+
+READ_PATHS = [
+    '/',
+    '/employees/data?draw=1&start=0&length=25&columns[0][data]=full_name&order[0][column]=0&order[0][dir]=asc',
+    '/feedback/',
+]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=DEFAULT_DATABASE)
+    parser.add_argument('--managers', type=int, default=20)
+    parser.add_argument('--employees', type=int, default=2000)
+    parser.add_argument('--feedback', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--clients', type=int, default=200, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per configuration')
+    parser.add_argument('--port', type=int, default=8055)
+    parser.add_argument('--configs', nargs='+', default=['sync:2:1', 'gthread:2:8'],
+                        help='worker configurations as worker_class:workers:threads')
+    parser.add_argument('--paths', nargs='+', default=READ_PATHS, help='paths requested in turn by each client')
+    return parser.parse_args(argv)
+
+
+def start_server(args, config):
+    worker_class, workers, threads = config.split(':')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, DATABASE_URL=args.database, SLOW_REQUEST_THRESHOLD_MS='0')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'main:app', '--bind', f'127.0.0.1:{args.port}',
+         '--worker-class', worker_class, '--workers', workers, '--threads', threads,
+         '--backlog', str(max(args.clients * 2, 2048)), '--log-level', 'warning'],
+        cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', args.port, timeout=1)
+            connection.request('GET', '/auth/login')
+            connection.getresponse().read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f'gunicorn did not start for {config}')
+
+
+def login(port, username):
+    """Session cookie for a manager"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    connection.request('POST', '/auth/login', body=f'username={username}&password=LM123',
+                       headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    response = connection.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie', '').split(';')[0]
+    if response.status != 302 or not cookie:
+        raise RuntimeError('Benchmark login failed')
+    return cookie
+
+
+def run_clients(args, cookie):
+    """Requests from args.clients threads for args.duration seconds"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(args.clients + 1)
+    stop_at = []
+
+    def client(index):
+        local_latencies = []
+        local_errors = 0
+        start.wait()
+        n = index
+        while time.monotonic() < stop_at[0]:
+            path = args.paths[n % len(args.paths)]
+            n += 1
+            started = time.perf_counter()
+            try:
+                # A new connection per request: sync workers close them anyway
+                connection = http.client.HTTPConnection('127.0.0.1', args.port, timeout=60)
+                connection.request('GET', path, headers={'Cookie': cookie})
+                response = connection.getresponse()
+                response.read()
+                connection.close()
+                if response.status != 200:
+                    local_errors += 1
+                    continue
+            except OSError:
+                local_errors += 1
+                continue
+            local_latencies.append((time.perf_counter() - started) * 1000)
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    stop_at.append(time.monotonic() + args.duration)
+    start.wait()
+    for thread in threads:
+        thread.join()
+    return latencies, sum(errors)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    app, db = setup_app(args.database)
+    from benchmarks.datagen import generate
+    with app.app_context():
+        summary = generate(db, args.managers, args.employees, args.feedback, seed=args.seed)
+        db.engine.dispose()
+
+    print(f'{args.clients} clients, {args.duration:.0f} s per configuration, '
+          f"logged in as a manager of {summary['largest_team_size']} employees")
+    print(f"{'configuration':16} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for config in args.configs:
+        server = start_server(args, config)
+        try:
+            cookie = login(args.port, f"manager{summary['largest_team_manager']}")
+            latencies, errors = run_clients(args, cookie)
+        finally:
+            server.terminate()
+            server.wait()
+
+        if not latencies:
+            print(f'{config:16} no successful requests ({errors} errors)')
+            continue
+        print(f'{config:16} {len(latencies) / args.duration:8.1f} {percentile(latencies, 50):9.1f} '
+              f'{percentile(latencies, 95):9.1f} {percentile(latencies, 99):9.1f} {errors:7d}')
+
+
+if __name__ == '__main__':
+    main()
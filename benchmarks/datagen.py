@@ -0,0 +1,142 @@
+"""
+Synthetic organisation data.
+
+Generates managers, employees and feedback with a realistic skew: team sizes
+and the amount of feedback per employee follow a Pareto distribution, so a
+few managers own large teams and a few employees have long histories, while
+most are small. Rows are written with bulk Core inserts and the dashboard
+counters are rebuilt afterwards.
+
+    python -m benchmarks.datagen --managers 50 --employees 5000 --feedback 60000
+"""
+import argparse
+import random
+from datetime import date, datetime, timedelta
+
+SKILLS = ['Python', 'Java', 'JavaScript', 'Go', 'SQL', 'DevOps', 'Testing', 'Design',
+          'Data Science', 'Cloud', 'Security', 'Mobile']
+ROLES = ['Engineer', 'Senior Engineer', 'Lead Engineer', 'Analyst', 'Tester', 'Architect']
+GRADES = ['G1', 'G2', 'G3', 'G4', 'G5', 'G6', 'G7']
+LOCATIONS = ['Pune', 'Bangalore', 'Chennai', 'Hyderabad', 'London', 'Kraków']
+FIRST_NAMES = ['Asha', 'Vinod', 'Anuja', 'Sooraj', 'Priya', 'Rahul', 'Meera', 'Arjun', 'Kavya', 'Nikhil',
+               'Divya', 'Rohan', 'Sneha', 'Karthik', 'Anita', 'Vikram']
+LAST_NAMES = ['Nair', 'Sharma', 'Iyer', 'Patel', 'Menon', 'Reddy', 'Kulkarni', 'Das', 'Joshi', 'Pillai']
+COMMENTS = ['Consistently delivers high quality work.', 'Needs to improve estimation.',
+            'Great collaboration with the team this month.', 'Took ownership of a difficult release.',
+            'Should focus on code review turnaround.', 'Mentored two new joiners.']
+
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def skewed_weights(rng, count, alpha):
+    """Pareto-distributed weights: a few large, most small"""
+    return [rng.paretovariate(alpha) for _ in range(count)]
+
+
+def generate(db, managers=20, employees=2000, feedback=20000, seed=42, skew=1.2,
+             chunk_size=DEFAULT_CHUNK_SIZE):
+    """Insert synthetic data into an empty database.
+
+    Manager users are named manager1..managerN and log in with the standard
+    manager password. Returns a dict describing what was generated.
+    """
+    from werkzeug.security import generate_password_hash
+    from models import User, Employee, Feedback
+    import stats
+
+    rng = random.Random(seed)
+    password_hash = generate_password_hash('LM123')
+
+    db.session.execute(db.insert(User), [
+        {'id': i, 'username': f'manager{i}', 'email': f'manager{i}@example.com',
+         'password_hash': password_hash, 'is_manager': True}
+        for i in range(1, managers + 1)
+    ])
+
+    manager_ids = list(range(1, managers + 1))
+    manager_weights = skewed_weights(rng, managers, skew)
+    employee_managers = rng.choices(manager_ids, weights=manager_weights, k=employees)
+
+    for start in range(0, employees, chunk_size):
+        rows = []
+        for i in range(start, min(start + chunk_size, employees)):
+            rows.append({
+                'id': i + 1,
+                'full_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i + 1}',
+                'joining_date': date(2012, 1, 1) + timedelta(days=rng.randint(0, 4500)),
+                'benzyl': f'BZ{i + 1:07d}',
+                'role': rng.choice(ROLES),
+                'skill': rng.choices(SKILLS, weights=range(len(SKILLS), 0, -1))[0],
+                'team': f'Team {employee_managers[i]}-{rng.randint(1, 3)}',
+                'grade': rng.choice(GRADES),
+                'designation': rng.choice(ROLES),
+                'location': rng.choice(LOCATIONS),
+                'manager_id': employee_managers[i],
+            })
+        db.session.execute(db.insert(Employee), rows)
+
+    # Feedback is given by the employee's manager, more of it to some employees,
+    # at most once per employee and month
+    employee_ids = list(range(1, employees + 1))
+    feedback_weights = skewed_weights(rng, employees, skew)
+    end_date = datetime(2025, 12, 31)
+    given = set()
+    generated = 0
+    while generated < feedback:
+        batch = min(chunk_size, feedback - generated)
+        targets = rng.choices(employee_ids, weights=feedback_weights, k=batch)
+        rows = []
+        for employee_id in targets:
+            feedback_date = end_date - timedelta(days=rng.randint(0, 6 * 365), minutes=rng.randint(0, 1440))
+            if (employee_id, feedback_date.strftime('%Y-%m')) in given:
+                continue
+            given.add((employee_id, feedback_date.strftime('%Y-%m')))
+            rows.append({
+                'id': generated + len(rows) + 1,
+                'employee_id': employee_id,
+                'provided_by_id': employee_managers[employee_id - 1],
+                'rating': rng.choices([1, 2, 3, 4, 5], weights=[1, 3, 8, 10, 5])[0],
+                'feedback_text': rng.choice(COMMENTS),
+                'feedback_date': feedback_date,
+                'month': feedback_date.strftime('%Y-%m'),
+            })
+        if rows:
+            db.session.execute(db.insert(Feedback), rows)
+        generated += len(rows)
+
+    db.session.commit()
+    stats.rebuild()
+
+    team_sizes = {}
+    for manager_id in employee_managers:
+        team_sizes[manager_id] = team_sizes.get(manager_id, 0) + 1
+    largest_team_manager = max(team_sizes, key=team_sizes.get) if team_sizes else 1
+    return {
+        'managers': managers,
+        'employees': employees,
+        'feedback': feedback,
+        'largest_team_manager': largest_team_manager,
+        'largest_team_size': team_sizes.get(largest_team_manager, 0),
+    }
+
+
+def main(argv=None):
+    from benchmarks.common import setup_app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='sqlite:////tmp/ems_benchmark.db')
+    parser.add_argument('--managers', type=int, default=50)
+    parser.add_argument('--employees', type=int, default=5000)
+    parser.add_argument('--feedback', type=int, default=60000)
+    parser.add_argument('--skew', type=float, default=1.2, help='Pareto alpha; lower is more skewed')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    app, db = setup_app(args.database)
+    with app.app_context():
+        summary = generate(db, args.managers, args.employees, args.feedback, seed=args.seed, skew=args.skew)
+    print(f"Generated {summary} in {args.database}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Index benchmark
+
+Fills a scratch database with employees and feedback, then shows the query
+plan and latency of the hot queries with and without the indexes declared
+in models.py.
+
+    python -m benchmarks.index_benchmark --employees 100000 --feedback 1000000
+"""
+import argparse
+import random
+import statistics
+import time
+from benchmarks.common import setup_app
+from benchmarks.datagen import generate
+
+DEFAULT_DATABASE = 'sqlite:////tmp/ems_index_benchmark.db'
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=DEFAULT_DATABASE,
+                        help='database URL to (re)create for the benchmark')
+    parser.add_argument('--managers', type=int, default=1000)
+    parser.add_argument('--employees', type=int, default=100000)
+    parser.add_argument('--feedback', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=50,
+                        help='executions per query and phase')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def hot_queries(db, args):
+    """The queries the indexes are meant to serve, with a parameter generator each"""
+    from models import Employee, Feedback
+    return [
+        ('team count by manager_id',
+         db.select(db.func.count(Employee.id)).where(Employee.manager_id == db.bindparam('manager_id')),
+         lambda rng: {'manager_id': rng.randint(1, args.managers)}),
+        ('employee by user_id',
+         db.select(Employee.id).where(Employee.user_id == db.bindparam('user_id')).limit(1),
+         lambda rng: {'user_id': rng.randint(1, args.managers)}),
+        ('skill distribution for manager',
+         db.select(Employee.skill, db.func.count(Employee.id))
+         .where(Employee.manager_id == db.bindparam('manager_id')).group_by(Employee.skill),
+         lambda rng: {'manager_id': rng.randint(1, args.managers)}),
+        ('feedback history for employee',
+         db.select(Feedback.id).where(Feedback.employee_id == db.bindparam('employee_id'))
+         .order_by(Feedback.feedback_date.desc()),
+         lambda rng: {'employee_id': rng.randint(1, args.employees)}),
+        ('recent feedback by provider',
+         db.select(Feedback.id).where(Feedback.provided_by_id == db.bindparam('provided_by_id'))
+         .order_by(Feedback.feedback_date.desc()).limit(5),
+         lambda rng: {'provided_by_id': rng.randint(1, args.managers)}),
+    ]
+
+
+def explain(db, statement, params):
+    prefix = 'EXPLAIN QUERY PLAN' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN'
+    compiled = statement.params(**params).compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f'{prefix} {compiled}')).fetchall()
+    # SQLite returns (id, parent, notused, detail); PostgreSQL a single text column
+    return [row[-1] for row in rows]
+
+
+def run_phase(db, args, label):
+    print(f'\n=== {label} ===')
+    results = {}
+    for name, statement, make_params in hot_queries(db, args):
+        rng = random.Random(args.seed)
+        plan = explain(db, statement, make_params(rng))
+        timings = []
+        for _ in range(args.repeat):
+            params = make_params(rng)
+            started = time.perf_counter()
+            db.session.execute(statement, params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = statistics.median(timings)
+        print(f'{name}: median {results[name]:.3f} ms')
+        for line in plan:
+            print(f'    {line}')
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    app, db = setup_app(args.database)
+
+    with app.app_context():
+        from models import create_missing_indexes
+        indexes = [index for table in db.metadata.sorted_tables for index in table.indexes]
+        for index in indexes:
+            index.drop(db.engine)
+
+        print(f'Filling {args.employees} employees and {args.feedback} feedback rows...')
+        started = time.perf_counter()
+        generate(db, args.managers, args.employees, args.feedback, seed=args.seed)
+        print(f'Filled in {time.perf_counter() - started:.1f} s')
+
+        before = run_phase(db, args, 'without indexes')
+        started = time.perf_counter()
+        create_missing_indexes()
+        if db.engine.dialect.name == 'sqlite':
+            db.session.execute(db.text('ANALYZE'))
+        print(f'\nCreated {len(indexes)} indexes in {time.perf_counter() - started:.1f} s')
+        after = run_phase(db, args, 'with indexes')
+
+    print('\n=== summary (median ms) ===')
+    for name in before:
+        speedup = before[name] / after[name] if after[name] else float('inf')
+        print(f'{name:32} {before[name]:10.3f} {after[name]:10.3f}   x{speedup:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Startup benchmark
+
+Imports ``main`` (what every gunicorn worker and ``flask`` CLI invocation
+does) in fresh interpreters under ``python -X importtime`` and reports the
+median wall time, the slowest imports, and whether modules that should only
+load on their own code paths (pandas and openpyxl for import/export) were
+pulled in:
+
+    python -m benchmarks.startup --runs 5
+
+Exits with status 1 when a forbidden module is imported or the median
+exceeds ``--max-ms``, so it can guard startup time in CI.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_DATABASE = 'sqlite:////tmp/ems_startup_benchmark.db'
+
+# Loaded on first use by the import/export code paths only
+DEFERRED_MODULES = ['pandas', 'openpyxl', 'numpy']
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=DEFAULT_DATABASE)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list')
+    parser.add_argument('--max-ms', type=float, help='fail when the median startup is slower')
+    parser.add_argument('--forbid', nargs='*', default=DEFERRED_MODULES,
+                        help='top-level modules that must not be imported at startup')
+    return parser.parse_args(argv)
+
+
+def parse_importtime(stderr):
+    """{module: (self_us, cumulative_us)} from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def measure(args):
+    """Wall time in ms and the import timings of one fresh start"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, DATABASE_URL=args.database)
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'],
+                            cwd=root, env=env, capture_output=True, text=True, check=True)
+    return (time.perf_counter() - started) * 1000, parse_importtime(result.stderr)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    timings = []
+    modules = {}
+    for _ in range(args.runs):
+        elapsed, modules = measure(args)
+        timings.append(elapsed)
+
+    median = statistics.median(timings)
+    print(f'startup over {args.runs} runs: median {median:.0f} ms, min {min(timings):.0f} ms, '
+          f'{len(modules)} modules imported')
+    print(f"{'module':48} {'self ms':>8} {'cumulative ms':>14}")
+    slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f'{name:48} {self_us / 1000:8.1f} {cumulative_us / 1000:14.1f}')
+
+    failures = []
+    imported = sorted({name.split('.')[0] for name in modules} & set(args.forbid))
+    if imported:
+        failures.append(f"imported at startup: {', '.join(imported)}")
+    if args.max_ms is not None and median > args.max_ms:
+        failures.append(f'median startup {median:.0f} ms exceeds {args.max_ms:.0f} ms')
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
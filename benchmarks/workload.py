@@ -0,0 +1,189 @@
+"""
+Scripted request workload.
+
+Generates a synthetic organisation, logs in as the manager with the largest
+team and replays a fixed mix of page views, list API calls, an export and
+an import through the Flask test client. Reports p50/p95/p99 latency and
+SQL statements per request for each scenario, and can save the results as
+a JSON baseline or compare against one:
+
+    python -m benchmarks.workload --save-baseline benchmarks/baseline.json
+    python -m benchmarks.workload --compare benchmarks/baseline.json
+
+A comparison fails (exit status 1) when a scenario issues more queries per
+request than the baseline, or its p95 latency exceeds the baseline by more
+than ``--tolerance``.
+"""
+import argparse
+import io
+import json
+import random
+import sys
+import time
+from sqlalchemy import event
+from benchmarks.common import setup_app, percentile
+
+DEFAULT_DATABASE = 'sqlite:////tmp/ems_workload_benchmark.db'
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=DEFAULT_DATABASE)
+    parser.add_argument('--managers', type=int, default=20)
+    parser.add_argument('--employees', type=int, default=2000)
+    parser.add_argument('--feedback', type=int, default=20000)
+    parser.add_argument('--iterations', type=int, default=30, help='requests per scenario')
+    parser.add_argument('--warmup', type=int, default=3, help='unmeasured requests per scenario')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save-baseline', metavar='PATH')
+    parser.add_argument('--compare', metavar='PATH')
+    parser.add_argument('--tolerance', type=float, default=1.0,
+                        help='allowed relative p95 regression when comparing (1.0 = +100%%)')
+    return parser.parse_args(argv)
+
+
+class QueryCounter:
+    """Counts SQL statements executed on an engine"""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args, **kwargs):
+        self.count += 1
+
+
+def import_file(rng, employee_count, rows=200):
+    """CSV that re-imports existing employees, so the dataset keeps its size"""
+    lines = ['Full Name,Joining Date,Benzyl,Role,Skill,Team,Manager Name,Grade,Designation,Location']
+    for i in rng.sample(range(1, employee_count + 1), min(rows, employee_count)):
+        lines.append(f'Employee {i},01-01-2020,BZ{i:07d},Engineer,Python,Team 1,,G1,Engineer,Pune')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def scenarios(rng, team_ids, employee_count):
+    """Scenario name -> callable(client) returning the response"""
+    datatables = ('/employees/data?draw=1&start={start}&length=25'
+                  '&columns[0][data]=full_name&columns[1][data]=skill&order[0][column]=0&order[0][dir]=asc')
+    return {
+        'dashboard': lambda client: client.get('/'),
+        'employee_list_page': lambda client: client.get('/employees'),
+        'employee_list_data': lambda client: client.get(
+            datatables.format(start=rng.randrange(0, max(employee_count - 25, 1)))),
+        'employee_detail': lambda client: client.get(f'/employees/{rng.choice(team_ids)}'),
+        'feedback_list': lambda client: client.get('/feedback/'),
+        'employee_feedback': lambda client: client.get(f'/feedback/employee/{rng.choice(team_ids)}'),
+        'employee_feedback_more': lambda client: client.get(
+            f'/feedback/employee/{rng.choice(team_ids)}/data?after=9999-12-31T00:00:00_0'),
+        'feedback_list_more': lambda client: client.get('/feedback/data?after=9999-12-31T00:00:00_0'),
+        'feedback_form': lambda client: client.get(f'/feedback/new/{rng.choice(team_ids)}'),
+        'team_feedback_form': lambda client: client.get('/feedback/team'),
+        'export_csv': lambda client: client.post('/import-export', data={'action': 'export', 'format': 'csv'}),
+        'import_csv': lambda client: client.post('/import-export', data={
+            'action': 'import',
+            'file': (io.BytesIO(import_file(rng, employee_count)), 'employees.csv')
+        }, content_type='multipart/form-data'),
+    }
+
+
+def run(app, db, args):
+    from benchmarks.datagen import generate
+    from models import Employee
+
+    with app.app_context():
+        summary = generate(db, args.managers, args.employees, args.feedback, seed=args.seed)
+        team_ids = [employee_id for (employee_id,) in db.session.query(Employee.id)
+                    .filter_by(manager_id=summary['largest_team_manager']).all()]
+        counter = QueryCounter(db.engine)
+
+    client = app.test_client()
+    response = client.post('/auth/login', data={'username': f"manager{summary['largest_team_manager']}",
+                                                 'password': 'LM123'})
+    if response.status_code != 302:
+        raise RuntimeError('Benchmark login failed')
+
+    rng = random.Random(args.seed)
+    results = {}
+    for name, request in scenarios(rng, team_ids, args.employees).items():
+        for _ in range(args.warmup):
+            request(client).get_data()
+
+        latencies = []
+        queries = []
+        for _ in range(args.iterations):
+            counter.count = 0
+            started = time.perf_counter()
+            response = request(client)
+            response.get_data()  # include streamed bodies
+            latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(counter.count)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{name} returned {response.status_code}')
+
+        results[name] = {
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'queries_per_request': max(queries),
+        }
+
+    return {
+        'dataset': {'managers': args.managers, 'employees': args.employees, 'feedback': args.feedback,
+                    'largest_team_size': summary['largest_team_size'], 'seed': args.seed},
+        'iterations': args.iterations,
+        'scenarios': results,
+    }
+
+
+def print_report(report):
+    print(f"Dataset: {report['dataset']}")
+    print(f"{'scenario':22} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'queries':>8}")
+    for name, result in report['scenarios'].items():
+        print(f"{name:22} {result['p50_ms']:10.2f} {result['p95_ms']:10.2f} {result['p99_ms']:10.2f} "
+              f"{result['queries_per_request']:8d}")
+
+
+def compare(report, baseline, tolerance):
+    """Regression messages for scenarios worse than the baseline"""
+    if baseline.get('dataset') != report['dataset']:
+        print('Warning: baseline was recorded with a different dataset')
+
+    regressions = []
+    for name, result in report['scenarios'].items():
+        expected = baseline.get('scenarios', {}).get(name)
+        if expected is None:
+            continue
+        if result['queries_per_request'] > expected['queries_per_request']:
+            regressions.append(f"{name}: {result['queries_per_request']} queries per request "
+                               f"(baseline {expected['queries_per_request']})")
+        if result['p95_ms'] > expected['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']:.2f} ms (baseline {expected['p95_ms']:.2f} ms)")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    app, db = setup_app(args.database)
+    report = run(app, db, args)
+    print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baseline saved to {args.save_baseline}')
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print('Regressions against baseline:')
+            for regression in regressions:
+                print(f'  {regression}')
+            sys.exit(1)
+        print('No regressions against baseline')
+
+
+if __name__ == '__main__':
+    main()
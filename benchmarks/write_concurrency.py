@@ -0,0 +1,160 @@
+"""
+Write concurrency benchmark
+
+Generates a synthetic organisation once per database profile (DB_PROFILE)
+and has many threads save feedback through the ORM session, one commit per
+feedback, while other threads keep reading the employee and feedback
+tables. Reports committed writes per second, commit latency and how many
+writes failed with "database is locked":
+
+    python -m benchmarks.write_concurrency --writers 16 --readers 16 --duration 10
+
+Each profile runs in its own process since the profile is applied when the
+application is imported.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from benchmarks.common import setup_app, percentile
+
+DEFAULT_DATABASE = 'sqlite:////tmp/ems_write_benchmark.db'
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=DEFAULT_DATABASE)
+    parser.add_argument('--managers', type=int, default=20)
+    parser.add_argument('--employees', type=int, default=2000)
+    parser.add_argument('--feedback', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--writers', type=int, default=16, help='threads saving feedback')
+    parser.add_argument('--readers', type=int, default=16, help='threads reading meanwhile')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per profile')
+    parser.add_argument('--profiles', nargs='+', default=['minimal', 'standard', 'production'])
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def run_profile(args):
+    """Measure the profile in $DB_PROFILE; runs in a child process"""
+    app, db = setup_app(args.database)
+    from sqlalchemy import func, select
+    from sqlalchemy.exc import IntegrityError, OperationalError
+    from benchmarks.datagen import generate
+    from models import Employee, Feedback
+
+    with app.app_context():
+        generate(db, args.managers, args.employees, args.feedback, seed=args.seed)
+        teams = db.session.execute(select(Employee.id, Employee.manager_id)).all()
+        db.session.remove()
+
+    latencies = []
+    counts = {'locked': 0, 'errors': 0, 'reads': 0}
+    lock = threading.Lock()
+    start = threading.Barrier(args.writers + args.readers + 1)
+    stop_at = []
+
+    def writer(index):
+        rng = random.Random(args.seed + index)
+        local_latencies = []
+        locked = errors = 0
+        with app.app_context():
+            start.wait()
+            while time.monotonic() < stop_at[0]:
+                employee_id, manager_id = rng.choice(teams)
+                started = time.perf_counter()
+                try:
+                    # Spread over many months: one entry per employee and month is allowed
+                    db.session.add(Feedback(employee_id=employee_id, provided_by_id=manager_id,
+                                            rating=rng.randint(1, 5), feedback_text='Benchmark feedback',
+                                            feedback_date=datetime.utcnow(),
+                                            month=f'{rng.randint(1900, 2099)}-{rng.randint(1, 12):02d}'))
+                    db.session.commit()
+                except OperationalError as e:
+                    db.session.rollback()
+                    if 'locked' in str(e):
+                        locked += 1
+                    else:
+                        errors += 1
+                    continue
+                except IntegrityError:
+                    # The month was already taken for this employee
+                    db.session.rollback()
+                    errors += 1
+                    continue
+                local_latencies.append((time.perf_counter() - started) * 1000)
+            db.session.remove()
+        with lock:
+            latencies.extend(local_latencies)
+            counts['locked'] += locked
+            counts['errors'] += errors
+
+    def reader(index):
+        rng = random.Random(-args.seed - index)
+        reads = errors = 0
+        with app.app_context():
+            start.wait()
+            while time.monotonic() < stop_at[0]:
+                employee_id, _ = rng.choice(teams)
+                try:
+                    db.session.execute(
+                        select(func.count(Feedback.id), func.avg(Feedback.rating))
+                        .where(Feedback.employee_id == employee_id)
+                    ).one()
+                    db.session.commit()
+                    reads += 1
+                except OperationalError:
+                    db.session.rollback()
+                    errors += 1
+            db.session.remove()
+        with lock:
+            counts['reads'] += reads
+            counts['errors'] += errors
+
+    threads = [threading.Thread(target=writer, args=(i,), daemon=True) for i in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(i,), daemon=True) for i in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    stop_at.append(time.monotonic() + args.duration)
+    start.wait()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        db.engine.dispose()
+    print(json.dumps(dict(counts, latencies=latencies)))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        run_profile(args)
+        return
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    child_args = [a for a in (argv if argv is not None else sys.argv[1:]) if a != '--child']
+    print(f'{args.writers} writers and {args.readers} readers, {args.duration:.0f} s per profile')
+    print(f"{'profile':12} {'commits/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'locked':>7} {'reads/s':>9}")
+    for profile in args.profiles:
+        env = dict(os.environ, DB_PROFILE=profile)
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.write_concurrency', '--child'] + child_args,
+            cwd=root, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        latencies = result['latencies']
+        if not latencies:
+            print(f"{profile:12} no successful commits ({result['locked']} locked, {result['errors']} errors)")
+            continue
+        print(f'{profile:12} {len(latencies) / args.duration:10.1f} {percentile(latencies, 50):9.1f} '
+              f"{percentile(latencies, 99):9.1f} {result['locked']:7d} {result['reads'] / args.duration:9.1f}")
+
+
+if __name__ == '__main__':
+    main()
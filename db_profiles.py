@@ -0,0 +1,152 @@
+"""
+Database configuration profiles.
+
+``DB_PROFILE`` selects how the engine is tuned:
+
+* ``minimal``     connection checks only (the settings used before profiles)
+* ``standard``    (default) also puts SQLite in WAL mode with
+                  ``synchronous=NORMAL`` and a busy timeout, so readers do not
+                  block the writer and concurrent writers wait for the lock
+                  instead of failing with "database is locked"
+* ``production``  larger connection pools for PostgreSQL and a longer busy
+                  timeout plus memory-mapped I/O and a bigger page cache for
+                  SQLite
+
+``DB_POOL_SIZE``, ``DB_MAX_OVERFLOW``, ``DB_POOL_TIMEOUT`` and
+``SQLITE_BUSY_TIMEOUT_MS`` override single values of the selected profile.
+
+When ``DATABASE_REPLICA_URL`` is set, reads made while handling GET and HEAD
+requests go to the replica. Writes, and every request from a browser that
+wrote within the last ``DB_REPLICA_STICKY_SECONDS``, use the primary so
+users see their own changes despite replication lag.
+"""
+import logging
+import os
+import sqlite3
+import time
+from flask import current_app, has_request_context, request, session as http_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+PROFILES = {
+    'minimal': {
+        'pool': {},
+        'sqlite_pragmas': {},
+    },
+    'standard': {
+        'pool': {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30},
+        'sqlite_pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+        },
+    },
+    'production': {
+        'pool': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 10},
+        'sqlite_pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 30000,
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64000,  # KiB, i.e. 64 MB
+            'temp_store': 'MEMORY',
+        },
+    },
+}
+
+# Pool settings that can be overridden one by one from the environment
+POOL_ENV = {
+    'pool_size': 'DB_POOL_SIZE',
+    'max_overflow': 'DB_MAX_OVERFLOW',
+    'pool_timeout': 'DB_POOL_TIMEOUT',
+}
+
+# Bind key of the read replica engine
+REPLICA = 'replica'
+
+# Pragmas applied to every new SQLite connection, set by configure()
+_sqlite_pragmas = {}
+
+
+def load_profile(name=None):
+    """Settings of the named profile (default: $DB_PROFILE or 'standard') with env overrides"""
+    name = name or os.environ.get('DB_PROFILE', 'standard')
+    if name not in PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {name!r}; choose one of {', '.join(PROFILES)}")
+
+    pool = dict(PROFILES[name]['pool'])
+    for option, variable in POOL_ENV.items():
+        if os.environ.get(variable):
+            pool[option] = int(os.environ[variable])
+    pragmas = dict(PROFILES[name]['sqlite_pragmas'])
+    if os.environ.get('SQLITE_BUSY_TIMEOUT_MS'):
+        pragmas['busy_timeout'] = int(os.environ['SQLITE_BUSY_TIMEOUT_MS'])
+    return name, pool, pragmas
+
+
+def engine_options(url, pool):
+    """SQLAlchemy engine options for a database URL"""
+    options = {'pool_recycle': 300, 'pool_pre_ping': True}
+    if url.startswith('sqlite'):
+        # SQLite waits for locks through busy_timeout; the QueuePool defaults
+        # are plenty for a file database and do not apply to :memory:
+        return options
+    options.update(pool)
+    return options
+
+
+def configure(app):
+    """Apply the selected profile and replica settings to the app config"""
+    name, pool, pragmas = load_profile()
+    _sqlite_pragmas.clear()
+    _sqlite_pragmas.update(pragmas)
+
+    url = app.config['SQLALCHEMY_DATABASE_URI']
+    app.config['DB_PROFILE'] = name
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url, pool)
+
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        app.config['SQLALCHEMY_BINDS'] = {REPLICA: dict(engine_options(replica_url, pool), url=replica_url)}
+    app.config['DB_REPLICA_STICKY_SECONDS'] = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', '5'))
+    logger.info(f"Database profile: {name}" + (" with read replica" if replica_url else ""))
+
+
+@event.listens_for(Engine, 'connect')
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not _sqlite_pragmas or not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, value in _sqlite_pragmas.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+    finally:
+        cursor.close()
+
+
+def _use_replica():
+    if not has_request_context() or request.method not in ('GET', 'HEAD'):
+        return False
+    return http_session.get('_db_primary_until', 0) < time.time()
+
+
+class RoutingSession(Session):
+    """Session that sends reads during GET requests to the read replica, if any"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engines = self._db.engines
+        if (bind is None and REPLICA in engines and not self._flushing
+                and not isinstance(clause, UpdateBase) and _use_replica()):
+            return engines[REPLICA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _stick_to_primary(session, flush_context):
+    # Let this browser read its own writes from the primary for a while
+    if REPLICA in session._db.engines and has_request_context():
+        http_session['_db_primary_until'] = time.time() + current_app.config['DB_REPLICA_STICKY_SECONDS']
@@ -0,0 +1,142 @@
+"""
+Content-addressed cache for generated documentation.
+
+A generated file is stored together with a ``<output>.sha256`` stamp holding
+the hash of the inputs it was built from. When the inputs hash to the same
+value the existing file is reused; otherwise it is rebuilt into a temporary
+file and moved into place atomically. Builds of the same output are
+serialised across threads and processes, so concurrent callers wait for the
+build already in flight and then reuse its result.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def hash_inputs(paths, extra=''):
+    """SHA-256 over the names and contents of the input files"""
+    digest = hashlib.sha256(extra.encode('utf-8'))
+    for path in sorted(set(paths)):
+        digest.update(os.path.relpath(path).encode('utf-8') + b'\0')
+        try:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(64 * 1024), b''):
+                    digest.update(block)
+        except OSError:
+            digest.update(b'<missing>')
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _stamp_path(output_path):
+    return f"{output_path}.sha256"
+
+
+def _read_stamp(output_path):
+    try:
+        with open(_stamp_path(output_path), 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def is_current(output_path, content_hash):
+    """True if output_path exists and was built from inputs with this hash"""
+    return os.path.exists(output_path) and _read_stamp(output_path) == content_hash
+
+
+def _current_umask():
+    # os.umask can only be read by setting it; done once at import, before
+    # any build thread could create files meanwhile
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+_UMASK = _current_umask()
+
+
+def _file_mode(path):
+    """Mode for a file replacing path: the existing file's, or 0o644 less the umask.
+
+    mkstemp creates files readable by their owner only, which would make the
+    documents unreadable to a web server running as another user.
+    """
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except OSError:
+        return 0o644 & ~_UMASK
+
+
+def _atomic_write_text(path, text):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.chmod(tmp_path, _file_mode(path))
+    os.replace(tmp_path, path)
+
+
+class _BuildLock:
+    """Exclusive lock for one output, held across threads and processes"""
+
+    def __init__(self, output_path):
+        key = os.path.abspath(output_path)
+        with _locks_guard:
+            self.thread_lock = _locks.setdefault(key, threading.Lock())
+        self.lock_path = f"{key}.lock"
+        self.lock_file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if fcntl is not None:
+            self.lock_file = open(self.lock_path, 'a')
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+        self.thread_lock.release()
+
+
+def build_if_changed(output_path, input_paths, build, extra=''):
+    """Make sure output_path is up to date with its inputs.
+
+    ``build(path)`` must write the document to ``path`` and raise on failure.
+    Returns True if the document was rebuilt, False if the cached file was
+    reused (possibly one that a concurrent caller just built).
+    """
+    content_hash = hash_inputs(input_paths, extra)
+    if is_current(output_path, content_hash):
+        return False
+
+    with _BuildLock(output_path):
+        # Another thread or process may have finished the same build meanwhile
+        if is_current(output_path, content_hash):
+            return False
+
+        directory = os.path.dirname(os.path.abspath(output_path))
+        suffix = os.path.splitext(output_path)[1]
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=suffix)
+        os.close(fd)
+        try:
+            build(tmp_path)
+            os.chmod(tmp_path, _file_mode(output_path))
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        _atomic_write_text(_stamp_path(output_path), content_hash)
+        return True
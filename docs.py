@@ -1,32 +1,52 @@
-from flask import Blueprint, send_file, flash, redirect, url_for
+from flask import Blueprint, current_app, flash, redirect, url_for
 from flask_login import login_required, current_user
 import os
+import shutil
+import threading
 from utils import require_manager
-import subprocess
+from jobs import job_handler, submit_job, result_path, set_progress
 
 # Create a Blueprint for documentation
 docs_bp = Blueprint('docs', __name__)
 
+def _warm_up_generator():
+    import generate_documentation
+    generate_documentation.warm_up()
+
+@docs_bp.record_once
+def warm_up_documentation(state):
+    """Load the documentation generator in the background once per worker"""
+    if state.app.config.get('DOCS_WARM_UP'):
+        threading.Thread(target=_warm_up_generator, name='ems-docs-warm-up', daemon=True).start()
+
 @docs_bp.route('/documentation')
 @login_required
 @require_manager
 def generate_and_download_docs():
-    """Generate and download the documentation PDF"""
+    """Start building the documentation PDF and show its job status page"""
     try:
-        # Run the documentation generator script
-        result = subprocess.run(['python', 'generate_documentation.py'], 
-                                capture_output=True, text=True, check=True)
-        
-        # Check if the file was created
-        if os.path.exists('EMS_Documentation.pdf'):
-            return send_file('EMS_Documentation.pdf', as_attachment=True)
-        else:
-            flash('Failed to generate documentation: ' + result.stdout, 'danger')
-            return redirect(url_for('employee.dashboard'))
-            
-    except subprocess.CalledProcessError as e:
-        flash(f'Error generating documentation: {e.stderr}', 'danger')
-        return redirect(url_for('employee.dashboard'))
+        job = submit_job('generate_documentation')
+        return redirect(url_for('jobs.job_status', job_id=job.id))
     except Exception as e:
         flash(f'Unexpected error: {str(e)}', 'danger')
-        return redirect(url_for('employee.dashboard'))
\ No newline at end of file
+        return redirect(url_for('employee.dashboard'))
+
+@job_handler('generate_documentation')
+def run_documentation_job(job, payload):
+    """Background job: build the documentation PDF in-process and keep a copy"""
+    # Already loaded by the warm-up thread when DOCS_WARM_UP is on; either
+    # way pygments and xhtml2pdf stay loaded for later builds in this worker
+    import generate_documentation
+    
+    set_progress(job.id, 'Generating documentation')
+    root = current_app.root_path
+    generated = os.path.join(root, 'EMS_Documentation.pdf')
+    
+    result = generate_documentation.create_pdf_documentation(generated, root=root)
+    if result.startswith('Error'):
+        raise RuntimeError(result)
+    
+    # Copy it so a later build cannot replace the file while it is downloaded
+    path = result_path(job.id, '.pdf')
+    shutil.copyfile(generated, path)
+    return {'path': path, 'name': 'EMS_Documentation.pdf', 'mimetype': 'application/pdf'}
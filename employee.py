@@ -1,50 +1,92 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, get_template_attribute
 from flask_login import login_required, current_user
+from sqlalchemy import String, cast, func, or_
 from werkzeug.utils import secure_filename
 from app import db
 from models import Employee, User, Feedback
-from datetime import datetime
-import pandas as pd
+from datetime import datetime, date
 import os
 import logging
-from utils import require_manager, export_employees_to_excel
+from utils import (require_manager, export_employees_to_excel, export_employees_to_csv, parse_datatables_args,
+                   write_employees_csv, write_employees_xlsx)
+from query_profiles import with_profile
+from stats import dashboard_counters, remove_employee_feedback, page_versions
+from identity import current_employee, current_employee_id
+from http_cache import conditional, employee_stamp
+from jobs import job_handler, submit_job, result_path, set_progress
+from feedback import feedback_page, feedback_rows_response
+from permissions import authorize, visible_employees
+import uuid
 
 logger = logging.getLogger(__name__)
 employee_bp = Blueprint('employee', __name__)
 
+# Columns the employee list API can sort and filter on, keyed by DataTables column name
+EMPLOYEE_LIST_COLUMNS = {
+    'full_name': Employee.full_name,
+    'benzyl': Employee.benzyl,
+    'role': Employee.role,
+    'skill': Employee.skill,
+    'team': Employee.team,
+    'grade': Employee.grade,
+    'designation': Employee.designation,
+    'location': Employee.location,
+    'joining_date': Employee.joining_date,
+    # Employees without feedback sort as 0 so keyset paging can continue past them
+    'average_rating': func.coalesce(Employee.average_rating, 0.0),
+    'last_rating': func.coalesce(Employee.last_rating, 0),
+}
+
+# Rating columns are numbers: they can be sorted on but are not matched as text
+EMPLOYEE_LIST_NUMERIC_COLUMNS = {'average_rating', 'last_rating'}
+
+# Upper bound on the page size a client can request
+EMPLOYEE_LIST_MAX_PAGE_SIZE = 500
+
+def _dashboard_stamps():
+    # The quarter shown on the dashboard changes with the date
+    if current_user.is_manager:
+        return [page_versions(current_user.id), date.today()]
+    return [page_versions(), employee_stamp(current_employee_id()), date.today()]
+
+def _employee_detail_stamps(employee_id):
+    stamp = employee_stamp(employee_id)
+    # Unknown employees fall through to the view's 404
+    return [stamp, page_versions()] if stamp is not None else None
+
 @employee_bp.route('/')
 @login_required
+@conditional(_dashboard_stamps)
 def dashboard():
-    # Basic statistics for the dashboard
-    total_employees = Employee.query.count()
+    # Basic statistics for the dashboard, read from the precomputed counters
+    counters = dashboard_counters(current_user.id if current_user.is_manager else None)
+    total_employees = counters['total_employees']
     # Add current date/time for dashboard display
     now = datetime.now()
     
     # For managers, show their team stats
     if current_user.is_manager:
-        managed_employees = Employee.query.filter_by(manager_id=current_user.id).count()
-        recent_feedback = Feedback.query.filter_by(provided_by_id=current_user.id)\
+        recent_feedback = with_profile(Feedback.query, 'feedback_with_people')\
+            .filter_by(provided_by_id=current_user.id)\
             .order_by(Feedback.feedback_date.desc()).limit(5).all()
         
-        # Team distribution by skill
-        team_skills = db.session.query(Employee.skill, db.func.count(Employee.id))\
-            .filter_by(manager_id=current_user.id)\
-            .group_by(Employee.skill).all()
-        
         context = {
             'total_employees': total_employees,
-            'managed_employees': managed_employees,
+            'managed_employees': counters['managed_employees'],
             'recent_feedback': recent_feedback,
-            'team_skills': team_skills,
+            'team_skills': counters['team_skills'],
+            'feedback_given': counters['feedback_given'],
+            'average_rating': counters['average_rating'],
             'is_manager': True,
             'now': now
         }
     else:
         # For regular employees, show their feedback
-        employee = Employee.query.filter_by(user_id=current_user.id).first()
+        employee = current_employee()
         
         if employee:
-            recent_feedback = Feedback.query.filter_by(employee_id=employee.id)\
+            recent_feedback = with_profile(Feedback.query, 'feedback_history')\
+                .filter_by(employee_id=employee.id)\
                 .order_by(Feedback.feedback_date.desc()).limit(5).all()
             
             context = {
@@ -65,37 +107,103 @@ def dashboard():
 
 @employee_bp.route('/employees')
 @login_required
+@conditional(lambda: [page_versions()])
 def employee_list():
-    # Filter employees based on user's role
-    if current_user.is_manager:
-        # Managers see all employees, but highlight their team
-        employees = Employee.query.all()
-    else:
-        # Regular employees only see themselves
-        employee = Employee.query.filter_by(user_id=current_user.id).first()
-        employees = [employee] if employee else []
-    
-    # Get all managers for the dropdown in templates
+    # Rows are fetched page by page from employee_list_data, so only the
+    # managers for the dropdown in templates are loaded here
     managers = User.query.filter_by(is_manager=True).all()
     
     return render_template('employee_list.html', 
-                           employees=employees, 
                            managers=managers,
                            is_manager=current_user.is_manager)
 
+@employee_bp.route('/employees/data')
+@login_required
+def employee_list_data():
+    """DataTables server-side processing endpoint for the employee list"""
+    params = parse_datatables_args(request.args, EMPLOYEE_LIST_COLUMNS,
+                                   max_length=EMPLOYEE_LIST_MAX_PAGE_SIZE)
+    
+    # Managers see all employees, but highlight their team; regular
+    # employees only see themselves
+    query = Employee.query.filter(visible_employees())
+    
+    # The unfiltered total is the headcount counter, not a COUNT per draw
+    if current_user.is_manager:
+        records_total = dashboard_counters()['total_employees']
+    else:
+        records_total = 1 if current_employee_id() else 0
+    
+    if params['search']:
+        pattern = f"%{params['search']}%"
+        query = query.filter(or_(*[column.ilike(pattern)
+                                   for name, column in EMPLOYEE_LIST_COLUMNS.items()
+                                   if name != 'joining_date' and name not in EMPLOYEE_LIST_NUMERIC_COLUMNS]))
+    for name, value in params['column_search'].items():
+        if name in EMPLOYEE_LIST_NUMERIC_COLUMNS:
+            continue
+        column = EMPLOYEE_LIST_COLUMNS[name]
+        if name == 'joining_date':
+            # Matched as ISO text ("2020-01"); ILIKE is not defined for dates on PostgreSQL
+            column = cast(column, String)
+        query = query.filter(column.ilike(f"%{value}%"))
+    
+    if params['search'] or params['column_search']:
+        records_filtered = query.order_by(None).count()
+    else:
+        records_filtered = records_total
+    
+    # Sort on the requested column with the primary key as tie-breaker so that
+    # rows do not move between pages
+    sort_column = EMPLOYEE_LIST_COLUMNS[params['order_column']]
+    descending = params['order_dir'] == 'desc'
+    if descending:
+        query = query.order_by(sort_column.desc(), Employee.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), Employee.id.asc())
+    
+    employees = query.offset(params['start']).limit(params['length']).all()
+    
+    row_actions = get_template_attribute('_employee_row_actions.html', 'row_actions')
+    data = []
+    for employee in employees:
+        data.append({
+            'id': employee.id,
+            'full_name': employee.full_name,
+            'benzyl': employee.benzyl,
+            'role': employee.role,
+            'skill': employee.skill,
+            'team': employee.team,
+            'grade': employee.grade,
+            'designation': employee.designation,
+            'location': employee.location,
+            'joining_date': employee.joining_date.isoformat(),
+            'average_rating': f'{employee.average_rating:.2f}' if employee.average_rating is not None else '',
+            'last_rating': employee.last_rating if employee.last_rating is not None else '',
+            'is_team_member': employee.manager_id == current_user.id,
+            'actions': str(row_actions(employee, current_user.is_manager, current_user.id)),
+        })
+    
+    return jsonify({
+        'draw': params['draw'],
+        'recordsTotal': records_total,
+        'recordsFiltered': records_filtered,
+        'data': data,
+    })
+
 @employee_bp.route('/employees/<int:employee_id>')
 @login_required
+@conditional(_employee_detail_stamps)
 def employee_detail(employee_id):
-    employee = Employee.query.get_or_404(employee_id)
-    
     # Regular employees can only view their own details
-    if not current_user.is_manager and not employee.user_id == current_user.id:
+    employee, allowed = authorize(Employee, employee_id, visible_employees())
+    if not allowed:
         flash('You do not have permission to view this employee.', 'danger')
         return redirect(url_for('employee.employee_list'))
     
-    # Get feedback for the employee
-    feedback = Feedback.query.filter_by(employee_id=employee.id)\
-        .order_by(Feedback.feedback_date.desc()).all()
+    # First page of the employee's feedback; the rest is loaded on demand
+    feedback, next_cursor = feedback_page(
+        with_profile(Feedback.query, 'feedback_history').filter_by(employee_id=employee.id))
     
     # Get manager info
     manager = User.query.get(employee.manager_id) if employee.manager_id else None
@@ -103,9 +211,21 @@ def employee_detail(employee_id):
     return render_template('employee_detail.html', 
                            employee=employee, 
                            feedback=feedback,
+                           next_cursor=next_cursor,
                            manager=manager,
                            is_manager=current_user.is_manager)
 
+@employee_bp.route('/employees/<int:employee_id>/feedback')
+@login_required
+def employee_detail_feedback(employee_id):
+    """Further pages of the feedback history on the employee detail page"""
+    employee, allowed = authorize(Employee, employee_id, visible_employees())
+    if not allowed:
+        return jsonify({'error': 'You do not have permission to view this employee.'}), 403
+    
+    query = with_profile(Feedback.query, 'feedback_history').filter_by(employee_id=employee.id)
+    return feedback_rows_response(query, 'for_employee', current_user.is_manager)
+
 @employee_bp.route('/employees/new', methods=['GET', 'POST'])
 @login_required
 @require_manager
@@ -209,7 +329,9 @@ def delete_employee(employee_id):
     employee = Employee.query.get_or_404(employee_id)
     
     try:
-        # Also delete related feedback
+        # Also delete related feedback; the bulk delete bypasses the session,
+        # so the dashboard counters are adjusted explicitly
+        remove_employee_feedback(employee.id)
         Feedback.query.filter_by(employee_id=employee.id).delete()
         
         db.session.delete(employee)
@@ -243,70 +365,33 @@ def import_export():
                 return redirect(request.url)
             
             # Check file extension
-            if file and file.filename.endswith(('.xlsx', '.xls', '.csv')):
+            if file and file.filename.endswith(('.xlsx', '.xls', '.csv')) and request.form.get('background'):
+                # Keep the upload on disk and let a background job import it
+                job_id = uuid.uuid4().hex
+                extension = os.path.splitext(secure_filename(file.filename))[1]
+                upload_path = result_path(job_id, f'-upload{extension}')
+                file.save(upload_path)
+                job = submit_job('import_employees', {
+                    'path': upload_path,
+                    'default_manager_id': current_user.id
+                }, job_id=job_id)
+                flash('Import started in the background', 'info')
+                return redirect(url_for('jobs.job_status', job_id=job.id))
+            elif file and file.filename.endswith(('.xlsx', '.xls', '.csv')):
                 try:
-                    # Read Excel/CSV file
-                    if file.filename.endswith('.csv'):
-                        df = pd.read_csv(file)
-                    else:
-                        df = pd.read_excel(file)
+                    # Read and import the Excel/CSV file chunk by chunk; the
+                    # importer loads pandas, so it is imported on first use
+                    from importer import import_upload
+                    report = import_upload(file.stream, file.filename, default_manager_id=current_user.id)
+                    imported_count = report['inserted'] + report['updated']
                     
-                    # Process data
-                    imported_count = 0
-                    for _, row in df.iterrows():
-                        # Check if employee exists
-                        existing_employee = Employee.query.filter_by(benzyl=row.get('Benzyl')).first()
-                        
-                        # Convert joining date
-                        joining_date = None
-                        joining_date_str = row.get('Joining Date')
-                        if isinstance(joining_date_str, str):
-                            try:
-                                joining_date = datetime.strptime(joining_date_str, '%d-%m-%Y').date()
-                            except ValueError:
-                                try:
-                                    joining_date = datetime.strptime(joining_date_str, '%Y-%m-%d').date()
-                                except ValueError:
-                                    logger.warning(f"Could not parse date: {joining_date_str}")
-                        elif isinstance(joining_date_str, pd.Timestamp):
-                            joining_date = joining_date_str.date()
-                        
-                        if not joining_date:
-                            continue
-                        
-                        if existing_employee:
-                            # Update existing employee
-                            existing_employee.full_name = row.get('Full Name')
-                            existing_employee.joining_date = joining_date
-                            existing_employee.role = row.get('Role')
-                            existing_employee.skill = row.get('Skill')
-                            existing_employee.team = row.get('Team')
-                            existing_employee.grade = row.get('Grade')
-                            existing_employee.designation = row.get('Designation')
-                            existing_employee.location = row.get('Location')
-                        else:
-                            # Create new employee
-                            manager_name = row.get('Manager Name')
-                            manager = User.query.filter_by(username=manager_name).first()
-                            
-                            new_employee = Employee(
-                                full_name=row.get('Full Name'),
-                                joining_date=joining_date,
-                                benzyl=row.get('Benzyl'),
-                                role=row.get('Role'),
-                                skill=row.get('Skill'),
-                                team=row.get('Team'),
-                                grade=row.get('Grade'),
-                                designation=row.get('Designation'),
-                                location=row.get('Location'),
-                                manager_id=manager.id if manager else current_user.id
-                            )
-                            db.session.add(new_employee)
-                        
-                        imported_count += 1
+                    if report['errors']:
+                        flash(f"Imported {imported_count} employees; "
+                              f"{len(report['errors'])} rows were skipped", 'warning')
+                    else:
+                        flash(f'Successfully imported {imported_count} employees', 'success')
                     
-                    db.session.commit()
-                    flash(f'Successfully imported {imported_count} employees', 'success')
+                    return render_template('import_export.html', import_report=report)
                     
                 except Exception as e:
                     db.session.rollback()
@@ -316,14 +401,54 @@ def import_export():
                 flash('File format not supported. Please upload an Excel or CSV file.', 'danger')
         
         elif action == 'export':
+            if request.form.get('background'):
+                job = submit_job('export_employees', {'format': request.form.get('format', 'xlsx')})
+                flash('Export started in the background', 'info')
+                return redirect(url_for('jobs.job_status', job_id=job.id))
+            
             try:
-                # Export all employees to Excel
-                excel_file = export_employees_to_excel()
+                # Export all employees, streamed as Excel or CSV
+                if request.form.get('format') == 'csv':
+                    export_file = export_employees_to_csv()
+                else:
+                    export_file = export_employees_to_excel()
                 
                 flash('Employee data exported successfully', 'success')
-                return excel_file
+                return export_file
             except Exception as e:
                 logger.error(f"Error exporting employees: {str(e)}")
                 flash(f'Error exporting employees: {str(e)}', 'danger')
     
     return render_template('import_export.html')
+
+@job_handler('import_employees')
+def run_import_job(job, payload):
+    """Background job: import an uploaded spreadsheet saved by import_export"""
+    from importer import import_upload
+    
+    path = payload['path']
+    try:
+        set_progress(job.id, 'Reading file')
+
+        def progress(rows_read, report):
+            set_progress(job.id, f"Processed {rows_read} rows: {report['inserted']} added, "
+                                 f"{report['updated']} updated, {len(report['errors'])} skipped")
+
+        report = import_upload(path, path, default_manager_id=payload['default_manager_id'], progress=progress)
+    finally:
+        os.remove(path)
+    
+    return {'result': report}
+
+@job_handler('export_employees')
+def run_export_job(job, payload):
+    """Background job: write the employee export to a downloadable file"""
+    if payload.get('format') == 'csv':
+        path = result_path(job.id, '.csv')
+        write_employees_csv(path)
+        return {'path': path, 'name': 'employee_data.csv', 'mimetype': 'text/csv'}
+    
+    path = result_path(job.id, '.xlsx')
+    write_employees_xlsx(path)
+    return {'path': path, 'name': 'employee_data.xlsx',
+            'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'}
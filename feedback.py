@@ -1,108 +1,152 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, get_template_attribute
 from flask_login import login_required, current_user
+import re
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from app import db
 from models import Employee, Feedback, User
 from datetime import datetime
 import logging
-from utils import require_manager, get_current_month
+from utils import require_manager, get_current_month, recent_months
+from query_profiles import with_profile
+from identity import current_employee_id
+import stats
+from stats import page_versions
+from http_cache import conditional, employee_stamp
+from permissions import authorize, direct_reports, feedback_subjects, listed_feedback, own_feedback
 
 logger = logging.getLogger(__name__)
 feedback_bp = Blueprint('feedback', __name__, url_prefix='/feedback')
 
+# Feedback rows per page of the feedback tables; more are loaded on demand
+FEEDBACK_PAGE_SIZE = 25
+
+# Feedback months are "YYYY-MM"
+MONTH_PATTERN = re.compile(r'\d{4}-(0[1-9]|1[0-2])')
+
+def _feedback_list_stamps():
+    if current_user.is_manager:
+        return [page_versions(current_user.id)]
+    return [page_versions(), employee_stamp(current_employee_id())]
+
+def _employee_feedback_stamps(employee_id):
+    stamp = employee_stamp(employee_id)
+    return [stamp, page_versions()] if stamp is not None else None
+
+def feedback_cursor(fb):
+    """Opaque position of a feedback row in the newest-first order"""
+    return f"{fb.feedback_date.isoformat()}_{fb.id}"
+
+def _parse_cursor(value):
+    try:
+        feedback_date, feedback_id = value.rsplit('_', 1)
+        return datetime.fromisoformat(feedback_date), int(feedback_id)
+    except (AttributeError, ValueError):
+        return None
+
+def feedback_page(query, after=None, size=FEEDBACK_PAGE_SIZE):
+    """One page of a feedback query, newest first, and the cursor of the next page.
+
+    Pages are keyed on (feedback_date, id) rather than an offset, so every
+    page costs the same and rows added meanwhile do not shift later pages.
+    The cursor is None on the last page.
+    """
+    query = query.order_by(Feedback.feedback_date.desc(), Feedback.id.desc())
+    cursor = _parse_cursor(after) if after else None
+    if cursor is not None:
+        query = query.filter(tuple_(Feedback.feedback_date, Feedback.id) < cursor)
+    rows = query.limit(size + 1).all()
+    if len(rows) > size:
+        return rows[:size], feedback_cursor(rows[size - 1])
+    return rows, None
+
+def feedback_rows_response(query, view_type, is_manager):
+    """JSON for the "Load more" button: the next page's table rows and cursor"""
+    feedback, next_cursor = feedback_page(query, request.args.get('after'))
+    feedback_rows = get_template_attribute('_feedback_rows.html', 'feedback_rows')
+    return jsonify({
+        'html': str(feedback_rows(feedback, view_type, is_manager, current_user.id)),
+        'next': next_cursor,
+    })
+
+def _feedback_list_query():
+    """The current user's feedback list query and its view type"""
+    # Managers see the feedback of their direct reportees only, employees
+    # the feedback they've received
+    if current_user.is_manager:
+        return with_profile(Feedback.query, 'feedback_with_people').filter(listed_feedback()), 'provided'
+    return with_profile(Feedback.query, 'feedback_history').filter(listed_feedback()), 'received'
+
+def _authorize_feedback_view(employee_id):
+    # Employees can view their own feedback, managers that of everyone in
+    # their organisation (direct reports and the teams below them)
+    return authorize(Employee, employee_id, feedback_subjects(employee_id))
+
 @feedback_bp.route('/')
 @login_required
+@conditional(_feedback_list_stamps)
 def feedback_list():
-    current_employee = Employee.query.filter_by(user_id=current_user.id).first()
+    query, view_type = _feedback_list_query()
+    feedback, next_cursor = feedback_page(query)
     
-    if current_user.is_manager:
-        # Get feedback strictly for direct reportees only
-        direct_reportees = Employee.query.filter_by(manager_id=current_user.id).all()
-        direct_reportee_ids = [emp.id for emp in direct_reportees]
-        
-        feedback = Feedback.query\
-            .join(Employee, Feedback.employee_id == Employee.id)\
-            .filter(Employee.id.in_(direct_reportee_ids))\
-            .order_by(Feedback.feedback_date.desc()).all()
-            
-        context = {
-            'feedback': feedback,
-            'is_manager': True,
-            'view_type': 'provided'
-        }
-    else:
-        # For employees, show only feedback they've received
-        if current_employee:
-            feedback = Feedback.query.filter_by(employee_id=current_employee.id)\
-                .order_by(Feedback.feedback_date.desc()).all()
-            
-            context = {
-                'feedback': feedback,
-                'is_manager': False,
-                'view_type': 'received'
-            }
-        else:
-            context = {
-                'feedback': [],
-                'is_manager': False,
-                'view_type': 'received'
-            }
-    
-    return render_template('feedback_list.html', **context)
+    return render_template('feedback_list.html',
+                           feedback=feedback,
+                           next_cursor=next_cursor,
+                           more_url=url_for('feedback.feedback_list_data'),
+                           is_manager=current_user.is_manager,
+                           view_type=view_type)
+
+@feedback_bp.route('/data')
+@login_required
+def feedback_list_data():
+    """Further pages of the feedback list"""
+    query, view_type = _feedback_list_query()
+    return feedback_rows_response(query, view_type, current_user.is_manager)
 
 @feedback_bp.route('/employee/<int:employee_id>')
 @login_required
+@conditional(_employee_feedback_stamps)
 def employee_feedback(employee_id):
-    employee = Employee.query.get_or_404(employee_id)
-    current_employee = Employee.query.filter_by(user_id=current_user.id).first()
-    
-    # Check permissions
-    has_access = False
-    
-    if current_user.is_manager:
-        # Only allow access if the employee directly reports to the current manager
-        if employee.manager_id == current_user.id:
-            has_access = True
+    employee, allowed = _authorize_feedback_view(employee_id)
     
-    # Employee can view their own feedback
-    if employee.user_id == current_user.id:
-        has_access = True
-        
-    if not has_access:
+    if not allowed:
         flash('You do not have permission to view this feedback.', 'danger')
         return redirect(url_for('feedback.feedback_list'))
     
-    # Get feedback for the employee
-    feedback = Feedback.query.filter_by(employee_id=employee.id)\
-        .order_by(Feedback.feedback_date.desc()).all()
+    # First page of the employee's feedback
+    feedback, next_cursor = feedback_page(
+        with_profile(Feedback.query, 'feedback_history').filter_by(employee_id=employee.id))
     
     return render_template('feedback_list.html', 
                            feedback=feedback,
+                           next_cursor=next_cursor,
+                           more_url=url_for('feedback.employee_feedback_data', employee_id=employee.id),
                            employee=employee,
                            is_manager=current_user.is_manager,
                            view_type='for_employee')
 
+@feedback_bp.route('/employee/<int:employee_id>/data')
+@login_required
+def employee_feedback_data(employee_id):
+    """Further pages of an employee's feedback"""
+    employee, allowed = _authorize_feedback_view(employee_id)
+    if not allowed:
+        return jsonify({'error': 'You do not have permission to view this feedback.'}), 403
+    
+    query = with_profile(Feedback.query, 'feedback_history').filter_by(employee_id=employee.id)
+    return feedback_rows_response(query, 'for_employee', current_user.is_manager)
+
 @feedback_bp.route('/new/<int:employee_id>', methods=['GET', 'POST'])
 @login_required
 @require_manager
 def create_feedback(employee_id):
-    employee = Employee.query.get_or_404(employee_id)
-    
-    # Get all direct reportees for the current manager
-    direct_reportees = Employee.query.filter_by(manager_id=current_user.id).all()
-    direct_reportee_ids = [emp.id for emp in direct_reportees]
-    
-    # Check if the employee is a direct reportee
-    if employee.id not in direct_reportee_ids:
+    # Feedback is given by the direct manager only
+    employee, allowed = authorize(Employee, employee_id, direct_reports())
+    if not allowed:
         flash('Access denied: You can only provide feedback for your direct reportees.', 'danger')
         return redirect(url_for('feedback.feedback_list'))
-
-    # Get all feedback for this employee to check viewing permissions
-    feedback_list = Feedback.query.filter_by(employee_id=employee_id).all()
-    
-    # Ensure the current user can only see feedback for their direct reportees
-    if not Employee.query.filter_by(id=employee_id, manager_id=current_user.id).first():
-        flash('Access denied: You can only view and provide feedback for your direct reportees.', 'danger')
-        return redirect(url_for('feedback.feedback_list'))
     
     if request.method == 'POST':
         try:
@@ -137,6 +181,9 @@ def create_feedback(employee_id):
             flash('Feedback submitted successfully', 'success')
             return redirect(url_for('feedback.employee_feedback', employee_id=employee_id))
             
+        except IntegrityError:
+            db.session.rollback()
+            flash(f'You have already given {employee.full_name} feedback for {month}.', 'danger')
         except Exception as e:
             db.session.rollback()
             logger.error(f"Error creating feedback: {str(e)}")
@@ -151,18 +198,127 @@ def create_feedback(employee_id):
                            feedback=None,
                            action='create')
 
+def _team_insert_statement(dialect_name):
+    """INSERT ... ON CONFLICT DO NOTHING RETURNING employee_id, or None if unsupported"""
+    if dialect_name == 'postgresql':
+        insert = postgresql.insert
+    elif dialect_name == 'sqlite':
+        insert = sqlite.insert
+    else:
+        return None
+    
+    return insert(Feedback).on_conflict_do_nothing(
+        index_elements=[Feedback.employee_id, Feedback.month, Feedback.provided_by_id]
+    ).returning(Feedback.employee_id)
+
+def validate_team_feedback(team, form):
+    """Check the team form in one pass.
+
+    Returns the rows to insert and {employee_id: error}; employees left
+    without a rating and text are skipped.
+    """
+    rows, errors = [], {}
+    now = datetime.utcnow()
+    month = form.get('month', '')
+    for employee in team:
+        rating = form.get(f'rating_{employee.id}', '').strip()
+        feedback_text = form.get(f'feedback_text_{employee.id}', '').strip()
+        if not rating and not feedback_text:
+            continue
+        if not rating.isdigit() or not 1 <= int(rating) <= 5:
+            errors[employee.id] = 'Rating must be between 1 and 5'
+        elif not feedback_text:
+            errors[employee.id] = 'Feedback is required'
+        else:
+            rows.append({
+                'employee_id': employee.id,
+                'provided_by_id': current_user.id,
+                'rating': int(rating),
+                'feedback_text': feedback_text,
+                'month': month,
+                'feedback_date': now,
+                'updated_at': now,
+            })
+    return rows, errors
+
+def insert_team_feedback(rows):
+    """Insert feedback rows with one statement and return the employee ids saved.
+
+    Rows that already exist for their employee, month and provider are
+    skipped by the unique index; without ON CONFLICT support a duplicate
+    fails the whole statement with IntegrityError.
+    """
+    if not rows:
+        return set()
+    statement = _team_insert_statement(db.session.connection().dialect.name)
+    if statement is None:
+        db.session.execute(db.insert(Feedback), rows)
+        saved = {row['employee_id'] for row in rows}
+    else:
+        saved = set(db.session.execute(statement, rows).scalars())
+    stats.add_inserted_feedback([row for row in rows if row['employee_id'] in saved])
+    return saved
+
+@feedback_bp.route('/team', methods=['GET', 'POST'])
+@login_required
+@require_manager
+def team_feedback():
+    """Feedback for all direct reports for one month, saved in one transaction"""
+    # Plain rows rather than entities, which the commit would expire and the
+    # template reload one by one
+    team = db.session.execute(
+        select(Employee.id, Employee.full_name, Employee.role)
+        .where(direct_reports()).order_by(Employee.full_name)
+    ).all()
+    month = request.form.get('month', get_current_month())
+    errors, saved = {}, set()
+    
+    if request.method == 'POST':
+        if not MONTH_PATTERN.fullmatch(month):
+            flash('Select a valid month', 'danger')
+            return redirect(url_for('feedback.team_feedback'))
+        
+        rows, errors = validate_team_feedback(team, request.form)
+        try:
+            saved = insert_team_feedback(rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception("Error saving team feedback")
+            flash('Error submitting feedback. Nothing was saved, please try again.', 'danger')
+        else:
+            for row in rows:
+                if row['employee_id'] not in saved:
+                    errors[row['employee_id']] = f'Feedback for {month} was already given'
+        
+        if saved:
+            flash(f'Feedback submitted for {len(saved)} team members', 'success')
+        if errors:
+            flash(f'{len(errors)} entries were not saved, see below', 'warning')
+        elif saved:
+            return redirect(url_for('feedback.feedback_list'))
+        elif not rows:
+            flash('Enter a rating and feedback for at least one team member', 'warning')
+    
+    return render_template('feedback_team.html',
+                           team=team,
+                           month=month,
+                           months=recent_months(),
+                           errors=errors,
+                           saved=saved,
+                           form=request.form)
+
 @feedback_bp.route('/edit/<int:feedback_id>', methods=['GET', 'POST'])
 @login_required
 @require_manager
 def edit_feedback(feedback_id):
-    feedback = Feedback.query.get_or_404(feedback_id)
-    
     # Make sure the feedback was provided by the current user
-    if feedback.provided_by_id != current_user.id:
+    feedback, allowed = authorize(Feedback, feedback_id, own_feedback(), joinedload(Feedback.employee))
+    if not allowed:
         flash('You can only edit feedback you provided.', 'danger')
         return redirect(url_for('feedback.feedback_list'))
     
-    employee = Employee.query.get(feedback.employee_id)
+    employee = feedback.employee
     
     if request.method == 'POST':
         try:
@@ -194,10 +350,9 @@ def edit_feedback(feedback_id):
 @login_required
 @require_manager
 def delete_feedback(feedback_id):
-    feedback = Feedback.query.get_or_404(feedback_id)
-    
     # Make sure the feedback was provided by the current user
-    if feedback.provided_by_id != current_user.id:
+    feedback, allowed = authorize(Feedback, feedback_id, own_feedback())
+    if not allowed:
         flash('You can only delete feedback you provided.', 'danger')
         return redirect(url_for('feedback.feedback_list'))
     
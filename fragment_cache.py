@@ -0,0 +1,195 @@
+"""
+Rendered-fragment cache for templates.
+
+Wrap a repeated, expensive block in ``{% cache kind, id, ... %}`` ...
+``{% endcache %}``. The first two arguments name the object the fragment
+belongs to (e.g. ``'feedback', fb.id``); the rest must cover everything else
+the block displays or branches on, typically the row's ``updated_at`` and the
+viewer's permissions. The rendered HTML is reused while all of them, and the
+deployed templates, are unchanged.
+
+Fragments are kept in a per-process LRU capped at ``FRAGMENT_CACHE_SIZE``
+objects and, when ``FRAGMENT_CACHE_DIR`` is set, in files shared by all
+worker processes. Changes to employees and feedback made through the ORM
+session drop the fragments of the changed rows; bulk statements are covered
+by the ``updated_at`` in the key.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from threading import Lock
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from http_cache import RELEASE
+from models import Employee, Feedback
+
+# Fragment kind used in templates for each model
+FRAGMENT_KINDS = {
+    Employee: 'employee',
+    Feedback: 'feedback',
+}
+
+
+class MemoryBackend:
+    """Thread-safe LRU of {variant: html} per object, capped at maxsize objects"""
+
+    def __init__(self, maxsize=5000):
+        self.maxsize = maxsize
+        self._objects = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, kind, object_id, variant):
+        with self._lock:
+            fragments = self._objects.get((kind, object_id))
+            if fragments is None or variant not in fragments:
+                return None
+            self._objects.move_to_end((kind, object_id))
+            return fragments[variant]
+
+    def put(self, kind, object_id, variant, html):
+        with self._lock:
+            self._objects.setdefault((kind, object_id), {})[variant] = html
+            self._objects.move_to_end((kind, object_id))
+            while len(self._objects) > self.maxsize:
+                self._objects.popitem(last=False)
+
+    def invalidate(self, kind, object_id):
+        with self._lock:
+            self._objects.pop((kind, object_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
+
+
+class FilesystemBackend:
+    """Fragments as files under directory/kind/id/, shared between processes"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _object_dir(self, kind, object_id):
+        return os.path.join(self.directory, kind, str(object_id))
+
+    def get(self, kind, object_id, variant):
+        try:
+            with open(os.path.join(self._object_dir(kind, object_id), f'{variant}.html'), encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, kind, object_id, variant, html):
+        object_dir = self._object_dir(kind, object_id)
+        os.makedirs(object_dir, exist_ok=True)
+        # Write to a temporary file first so readers never see a partial fragment
+        fd, temp_path = tempfile.mkstemp(dir=object_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(html)
+        os.replace(temp_path, os.path.join(object_dir, f'{variant}.html'))
+
+    def invalidate(self, kind, object_id):
+        shutil.rmtree(self._object_dir(kind, object_id), ignore_errors=True)
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class FragmentCache:
+    """The memory LRU, backed by an optional filesystem backend"""
+
+    def __init__(self):
+        self.memory = MemoryBackend()
+        self.filesystem = None
+        self.enabled = True
+
+    def get_or_render(self, kind, object_id, variant_parts, render):
+        if not self.enabled:
+            return render()
+        variant = hashlib.sha1(repr((RELEASE, variant_parts)).encode()).hexdigest()
+
+        html = self.memory.get(kind, object_id, variant)
+        if html is None and self.filesystem is not None:
+            html = self.filesystem.get(kind, object_id, variant)
+            if html is not None:
+                self.memory.put(kind, object_id, variant, html)
+        if html is None:
+            html = str(render())
+            self.memory.put(kind, object_id, variant, html)
+            if self.filesystem is not None:
+                self.filesystem.put(kind, object_id, variant, html)
+        return html
+
+    def invalidate(self, kind, object_id):
+        self.memory.invalidate(kind, object_id)
+        if self.filesystem is not None:
+            self.filesystem.invalidate(kind, object_id)
+
+    def clear(self):
+        self.memory.clear()
+        if self.filesystem is not None:
+            self.filesystem.clear()
+
+
+fragments = FragmentCache()
+
+
+class FragmentCacheExtension(Extension):
+    """``{% cache kind, id, *variant %}...{% endcache %}``"""
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(args)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        kind, object_id, *variant = key
+        # Markup so the cached HTML is not escaped again by autoescaping callers
+        return Markup(fragments.get_or_render(kind, object_id, tuple(variant), caller))
+
+
+def init_app(app):
+    """Enable the {% cache %} tag and apply the FRAGMENT_CACHE_* config"""
+    fragments.memory.maxsize = app.config.get('FRAGMENT_CACHE_SIZE', fragments.memory.maxsize)
+    fragments.enabled = app.config.get('FRAGMENT_CACHE_ENABLED', True)
+    directory = app.config.get('FRAGMENT_CACHE_DIR')
+    fragments.filesystem = FilesystemBackend(directory) if directory else None
+    app.jinja_env.add_extension(FragmentCacheExtension)
+
+
+def _changed_fragments(session):
+    changed = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        kind = FRAGMENT_KINDS.get(type(obj))
+        if kind and obj.id is not None:
+            changed.add((kind, obj.id))
+    return changed
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_on_flush(session, flush_context):
+    changed = _changed_fragments(session)
+    for kind, object_id in changed:
+        fragments.invalidate(kind, object_id)
+    # Drop them again on commit in case another request re-rendered the old
+    # rows between this flush and the commit
+    session.info.setdefault('fragments_invalidate', set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    for kind, object_id in session.info.pop('fragments_invalidate', ()):
+        fragments.invalidate(kind, object_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('fragments_invalidate', None)
@@ -5,6 +5,16 @@ from pygments.lexers import get_lexer_for_filename, PythonLexer
 from pygments.formatters import HtmlFormatter
 from xhtml2pdf import pisa
 import datetime
+import threading
+from doc_cache import build_if_changed
+
+# Lexers resolved per file extension; get_lexer_for_filename scans every
+# installed lexer, so it is only done once per extension per process
+_lexers = {}
+
+# Highlighted HTML per file, keyed by path and reused while (mtime, size) match
+_highlight_cache = {}
+_highlight_lock = threading.Lock()
 
 def get_file_content(file_path):
     """Read file content with proper encoding handling"""
@@ -17,20 +27,51 @@ def get_file_content(file_path):
     except Exception as e:
         return f"Error reading file: {str(e)}"
 
+def get_lexer(file_path):
+    """Lexer for a file, cached by extension"""
+    extension = os.path.splitext(file_path)[1]
+    if extension not in _lexers:
+        if extension == '.py':
+            _lexers[extension] = PythonLexer()
+        else:
+            _lexers[extension] = get_lexer_for_filename(file_path)
+    return _lexers[extension]
+
 def highlight_code(code, file_path):
     """Highlight code based on file extension"""
     try:
-        if file_path.endswith('.py'):
-            lexer = PythonLexer()
-        else:
-            lexer = get_lexer_for_filename(file_path)
-        return highlight(code, lexer, HtmlFormatter(full=False))
+        return highlight(code, get_lexer(file_path), HtmlFormatter(full=False))
     except Exception:
         # If highlighting fails, return the code as is
         return f"<pre>{code}</pre>"
 
-def create_pdf_documentation():
-    """Generate PDF documentation with all code files"""
+def highlight_file(file_path):
+    """Highlighted HTML for a file, only re-highlighted when the file changes"""
+    try:
+        stat = os.stat(file_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        key = None
+    
+    with _highlight_lock:
+        cached = _highlight_cache.get(file_path)
+    if key is not None and cached and cached[0] == key:
+        return cached[1]
+    
+    highlighted = highlight_code(get_file_content(file_path), file_path)
+    if key is not None:
+        with _highlight_lock:
+            _highlight_cache[file_path] = (key, highlighted)
+    return highlighted
+
+def warm_up():
+    """Load lexers and styles up front so the first build in a process is not slower"""
+    for sample in ('x.py', 'x.html', 'x.css', 'x.js'):
+        get_lexer(sample)
+    HtmlFormatter().get_style_defs('.highlight')
+
+def collect_source_files(root='.'):
+    """List the source files included in the documentation, relative to root"""
     # List of directories to include
     directories = [
         '.', 'templates', 'static/css', 'static/js'
@@ -50,10 +91,10 @@ def create_pdf_documentation():
     # Collect all files
     all_files = []
     for directory in directories:
-        if os.path.exists(directory):
+        if os.path.exists(os.path.join(root, directory)):
             for ext in extensions:
                 pattern = os.path.join(directory, '**', ext)
-                files = glob.glob(pattern, recursive=True)
+                files = glob.glob(pattern, root_dir=root, recursive=True)
                 all_files.extend(files)
     
     # Filter excluded files
@@ -69,7 +110,10 @@ def create_pdf_documentation():
     
     # Sort files by type and name
     filtered_files.sort(key=lambda x: (os.path.splitext(x)[1], x))
-    
+    return filtered_files
+
+def render_html(filtered_files, root='.'):
+    """Render the documentation HTML for the given files (relative to root)"""
     # Create HTML for PDF
     css = HtmlFormatter().get_style_defs('.highlight')
     html = f"""
@@ -116,8 +160,7 @@ def create_pdf_documentation():
     
     # Add each file content
     for file_path in filtered_files:
-        content = get_file_content(file_path)
-        highlighted_content = highlight_code(content, file_path)
+        highlighted_content = highlight_file(os.path.join(root, file_path))
         file_id = file_path.replace("/", "_").replace(".", "_")
         
         html += f"""
@@ -133,16 +176,40 @@ def create_pdf_documentation():
     </body>
     </html>
     """
+    return html
+
+def render_pdf(dest, filtered_files, root='.'):
+    """Render the documentation of the given files as PDF into a file-like object.
+
+    Always renders; use create_pdf_documentation() to reuse an up-to-date file.
+    """
+    pisa_status = pisa.CreatePDF(render_html(filtered_files, root), dest=dest)
+    if pisa_status.err:
+        raise RuntimeError(pisa_status.err)
+
+def create_pdf_documentation(output_path="EMS_Documentation.pdf", root='.'):
+    """Generate PDF documentation with all code files.
+
+    The PDF is only rebuilt when one of the documented files (or this
+    generator) has changed since the last build. Can be imported and called
+    in-process; ``root`` is the directory whose sources are documented.
+    """
+    filtered_files = collect_source_files(root)
+    inputs = [os.path.join(root, file_path) for file_path in filtered_files]
     
-    # Convert HTML to PDF
-    output_path = "EMS_Documentation.pdf"
-    with open(output_path, "w+b") as pdf_file:
-        pisa_status = pisa.CreatePDF(html, dest=pdf_file)
+    def build(path):
+        with open(path, "w+b") as pdf_file:
+            render_pdf(pdf_file, filtered_files, root)
     
-    if pisa_status.err:
-        return f"Error creating PDF: {pisa_status.err}"
-    else:
+    try:
+        rebuilt = build_if_changed(output_path, inputs + [os.path.abspath(__file__)], build)
+    except RuntimeError as e:
+        return f"Error creating PDF: {e}"
+    
+    if rebuilt:
         return f"PDF documentation created successfully at {output_path}"
+    else:
+        return f"PDF documentation is up to date at {output_path}"
 
 if __name__ == "__main__":
-    print(create_pdf_documentation())
\ No newline at end of file
+    print(create_pdf_documentation())
@@ -0,0 +1,23 @@
+"""
+Gunicorn settings, picked up automatically when gunicorn is started from this
+directory (as the deployment's ``gunicorn --bind 0.0.0.0:5000 main:app`` is).
+
+The defaults are gunicorn's own: one sync worker serving one request at a
+time. Threaded workers are opt-in with GUNICORN_WORKER_CLASS=gthread and
+GUNICORN_THREADS; measure with ``python -m benchmarks.concurrency`` against
+the production database first, as on local SQLite they were slower than sync
+workers. Gunicorn's command-line flags override these settings.
+"""
+import os
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+
+# Each worker process has its own caches and background job pool
+workers = int(os.environ.get('GUNICORN_WORKERS', '1'))
+
+# Only used by gthread workers; keep workers x threads at or below the
+# SQLAlchemy pool size (5 + 10 overflow) so threads do not queue for a connection
+threads = int(os.environ.get('GUNICORN_THREADS', '1'))
+
+# Idle keep-alive connections hold a thread; drop them quickly
+keepalive = 5
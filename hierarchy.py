@@ -0,0 +1,145 @@
+"""
+Organisation hierarchy.
+
+Employees report to a manager User (``Employee.manager_id``). An employee can
+have a User account of their own (``Employee.user_id``) and manage employees
+in turn, which makes the organisation a tree of any depth. It is walked with
+recursive CTEs, supported by both SQLite and PostgreSQL:
+
+* downwards from a manager through ``ix_employees_manager_id_skill``, for the
+  whole subtree below them
+* upwards from an employee through ``ix_employees_user_id``, for the chain of
+  managers above them; a permission check is one EXISTS over that chain
+
+Nothing is stored, so the hierarchy is always current. Walks stop after
+``MAX_DEPTH`` levels, which also ends them if bad data contains a cycle.
+"""
+from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask_login import login_required, current_user
+from sqlalchemy import case, func, literal, select
+from sqlalchemy.orm import aliased
+from app import db
+from models import Employee, Feedback, User
+from utils import require_manager, int_arg
+
+hierarchy_bp = Blueprint('hierarchy', __name__)
+
+MAX_DEPTH = 32
+
+
+def _subtree_cte(manager_id):
+    """(root_id, employee_id, user_id, depth) for everyone below the manager.
+
+    Each direct report is the root of their own branch (depth 0).
+    """
+    anchor = select(Employee.id.label('root_id'), Employee.id.label('employee_id'),
+                    Employee.user_id.label('user_id'), literal(0).label('depth'))\
+        .where(Employee.manager_id == manager_id)
+    tree = anchor.cte('org_subtree', recursive=True)
+    below = aliased(Employee, name='below')
+    return tree.union_all(
+        select(tree.c.root_id, below.id, below.user_id, tree.c.depth + 1)
+        .join(below, below.manager_id == tree.c.user_id)
+        .where(tree.c.depth < MAX_DEPTH)
+    )
+
+
+def _chain_cte(employee_id):
+    """(manager_id, depth) for every manager above the employee, nearest first"""
+    anchor = select(Employee.manager_id.label('manager_id'), literal(1).label('depth'))\
+        .where(Employee.id == employee_id)
+    chain = anchor.cte('org_chain', recursive=True)
+    above = aliased(Employee, name='above')
+    return chain.union_all(
+        select(above.manager_id, chain.c.depth + 1)
+        .join(above, above.user_id == chain.c.manager_id)
+        .where(chain.c.depth < MAX_DEPTH)
+    )
+
+
+def subtree_employee_ids(manager_id):
+    """Select of the ids of every employee below the manager, at any depth"""
+    tree = _subtree_cte(manager_id)
+    return select(tree.c.employee_id)
+
+
+def manages_condition(manager_id, employee_id):
+    """EXISTS clause of manages(), to embed in a larger query"""
+    chain = _chain_cte(employee_id)
+    return select(chain.c.manager_id).where(chain.c.manager_id == manager_id).exists()
+
+
+def manages(manager_id, employee_id):
+    """Whether the employee reports to the manager, directly or further down"""
+    return db.session.execute(select(manages_condition(manager_id, employee_id))).scalar()
+
+
+def management_chain(employee_id):
+    """Ids of the managers above the employee, from the direct manager upwards"""
+    chain = _chain_cte(employee_id)
+    return db.session.execute(
+        select(chain.c.manager_id).where(chain.c.manager_id.isnot(None)).order_by(chain.c.depth)
+    ).scalars().all()
+
+
+def team_rollup(manager_id):
+    """Headcount and feedback totals per direct report's branch, in one query.
+
+    Returns one dict per direct report, ordered by name; ``team_size``
+    includes the direct report themselves.
+    """
+    tree = _subtree_cte(manager_id)
+    root = aliased(Employee, name='root')
+    rows = db.session.execute(
+        select(root.id, root.full_name, root.role, root.user_id,
+               func.count(func.distinct(case((tree.c.depth == 1, tree.c.employee_id)))).label('direct_reports'),
+               func.count(func.distinct(tree.c.employee_id)).label('team_size'),
+               func.count(Feedback.id).label('feedback_count'),
+               func.sum(Feedback.rating).label('rating_sum'),
+               func.max(Feedback.month).label('last_month'))
+        .select_from(tree)
+        .join(root, root.id == tree.c.root_id)
+        .outerjoin(Feedback, Feedback.employee_id == tree.c.employee_id)
+        .group_by(root.id, root.full_name, root.role, root.user_id)
+        .order_by(root.full_name)
+    ).all()
+    return [{
+        'employee_id': row.id,
+        'full_name': row.full_name,
+        'role': row.role,
+        'user_id': row.user_id,
+        'direct_reports': row.direct_reports,
+        'team_size': row.team_size,
+        'feedback_count': row.feedback_count,
+        'rating_sum': row.rating_sum or 0,
+        'average_rating': round(row.rating_sum / row.feedback_count, 2) if row.feedback_count else None,
+        'last_month': row.last_month,
+    } for row in rows]
+
+
+@hierarchy_bp.route('/team')
+@login_required
+@require_manager
+def team():
+    """Rollup of the logged-in manager's organisation, or of a manager below them"""
+    employee_id = int_arg(request.args, 'employee', None)
+    manager = current_user
+    employee = None
+    if employee_id is not None:
+        employee = Employee.query.get_or_404(employee_id)
+        if not employee.user_id or not manages(current_user.id, employee.id):
+            flash('You can only view teams within your organisation.', 'danger')
+            return redirect(url_for('hierarchy.team'))
+        manager = db.session.get(User, employee.user_id)
+
+    branches = team_rollup(manager.id)
+    feedback_count = sum(branch['feedback_count'] for branch in branches)
+    totals = {
+        'direct_reports': len(branches),
+        'team_size': sum(branch['team_size'] for branch in branches),
+        'feedback_count': feedback_count,
+        'average_rating': round(sum(branch['rating_sum'] for branch in branches) / feedback_count, 2)
+        if feedback_count else None,
+    }
+    return render_template('team.html', manager=manager, employee=employee,
+                           branches=branches, totals=totals)
@@ -0,0 +1,102 @@
+"""
+Conditional GET for HTML pages.
+
+A view lists the version stamps its page is rendered from: the version
+counters in ``stats.page_versions`` and ``employee_stamp`` for a single
+employee's record and feedback. Those stamps, the logged-in user and the
+deployed code form the page's ETag. When a request's If-None-Match matches,
+the view is not called at all and ``304 Not Modified`` is returned, so no
+page queries run and no template is rendered.
+
+Responses carry ``Cache-Control: private, no-cache``: browsers keep the page
+but revalidate it on every view. Last-Modified is sent when the stamps include
+timestamps; only the ETag is used to decide on a 304, since row counts and
+version counters change without a timestamp.
+"""
+import hashlib
+import os
+from datetime import datetime
+from functools import wraps
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import func, select
+from app import db
+from models import Employee, Feedback
+
+
+def _release_stamp():
+    """Changes whenever the application code or templates are redeployed"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    stamp = hashlib.sha1()
+    for directory in (root, os.path.join(root, 'templates')):
+        for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+            if entry.is_file() and entry.name.endswith(('.py', '.html')):
+                stamp.update(f'{entry.name}:{entry.stat().st_mtime_ns}'.encode())
+    return stamp.hexdigest()[:12]
+
+
+RELEASE = _release_stamp()
+
+
+def employee_stamp(employee_id):
+    """Version stamp of an employee's record and feedback, or None if it does not exist"""
+    row = db.session.execute(
+        select(Employee.updated_at, Employee.manager_id, Employee.user_id,
+               func.max(Feedback.updated_at), func.count(Feedback.id))
+        .outerjoin(Feedback, Feedback.employee_id == Employee.id)
+        .where(Employee.id == employee_id)
+        .group_by(Employee.id)
+    ).first()
+    return tuple(row) if row is not None else None
+
+
+def page_etag(stamps):
+    parts = repr((RELEASE, current_user.get_id(), current_user.is_manager, stamps))
+    return hashlib.sha1(parts.encode()).hexdigest()
+
+
+def _latest(stamps):
+    latest = None
+    for stamp in stamps:
+        values = stamp if isinstance(stamp, (tuple, list)) else (stamp,)
+        for value in values:
+            if isinstance(value, datetime) and (latest is None or value > latest):
+                latest = value
+    return latest
+
+
+def conditional(stamps):
+    """Answer GETs with 304 Not Modified while the page's stamps are unchanged.
+
+    ``stamps`` is called with the view's arguments and returns a list of
+    hashable values the page depends on, or None to always render.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Pending flash messages are part of the page and must be rendered
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            page_stamps = stamps(**kwargs)
+            if page_stamps is None:
+                return view(*args, **kwargs)
+
+            etag = page_etag(page_stamps)
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            last_modified = _latest(page_stamps)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,100 @@
+"""
+Identity cache for the login manager.
+
+``load_user`` runs on every authenticated request, and most views then look
+up the Employee record linked to the user. Both answers are kept in a small
+per-process LRU cache with a TTL, so steady-state page views do not query
+the users table for identity at all.
+
+Entries are dropped when a User, or an Employee's ``user_id``, is changed
+through the ORM session in this process. Other worker processes pick up such
+changes when their entry expires (``IDENTITY_CACHE_TTL`` seconds).
+"""
+from flask_login import current_user
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from app import db
+from models import User, Employee
+from ttl_cache import TTLCache
+
+
+cache = TTLCache()
+
+# User columns copied into the cache
+_USER_COLUMNS = [column.key for column in User.__table__.columns]
+
+
+def configure(app):
+    """Apply IDENTITY_CACHE_SIZE / IDENTITY_CACHE_TTL from the app config"""
+    cache.maxsize = app.config.get('IDENTITY_CACHE_SIZE', cache.maxsize)
+    cache.ttl = app.config.get('IDENTITY_CACHE_TTL', cache.ttl)
+
+
+def load_identity(user_id):
+    """User for the login manager, with ``employee_id`` of the linked Employee.
+
+    Returns a detached User built from cached column values, or None if the
+    user does not exist.
+    """
+    entry = cache.get(user_id)
+    if entry is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        employee_id = db.session.execute(
+            select(Employee.id).where(Employee.user_id == user_id).limit(1)
+        ).scalar()
+        entry = ({column: getattr(user, column) for column in _USER_COLUMNS}, employee_id)
+        cache.put(user_id, entry)
+
+    columns, employee_id = entry
+    user = User(**columns)
+    user.employee_id = employee_id
+    return user
+
+
+def current_employee_id():
+    """Id of the Employee linked to the logged-in user, or None"""
+    return getattr(current_user, 'employee_id', None)
+
+
+def current_employee():
+    """Employee linked to the logged-in user, or None"""
+    employee_id = current_employee_id()
+    return db.session.get(Employee, employee_id) if employee_id else None
+
+
+def _affected_user_ids(session):
+    user_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            user_ids.add(obj.id)
+        elif isinstance(obj, Employee):
+            history = inspect(obj).attrs.user_id.history
+            user_ids.update(history.added or ())
+            user_ids.update(history.deleted or ())
+            user_ids.update(history.unchanged or ())
+    user_ids.discard(None)
+    return user_ids
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_on_flush(session, flush_context):
+    user_ids = _affected_user_ids(session)
+    if user_ids:
+        for user_id in user_ids:
+            cache.invalidate(user_id)
+        # Drop them again on commit in case another request re-cached the old
+        # rows between this flush and the commit
+        session.info.setdefault('identity_invalidate', set()).update(user_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    for user_id in session.info.pop('identity_invalidate', ()):
+        cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('identity_invalidate', None)
@@ -0,0 +1,304 @@
+"""
+Bulk employee import.
+
+Uploaded spreadsheets are read in chunks of ``IMPORT_CHUNK_SIZE`` rows
+(``read_csv(chunksize=...)`` for CSV, openpyxl's read-only row iterator for
+xlsx), so memory use is bounded by the chunk size rather than the file size.
+Each chunk is validated column-wise with pandas, managers are resolved from a
+single prefetched lookup, and rows are written with one
+INSERT ... ON CONFLICT (benzyl) DO UPDATE statement per batch, committing
+after each batch. Rows that cannot be imported are collected in a per-row
+error report instead of aborting the whole file.
+"""
+import logging
+from datetime import datetime
+import pandas as pd
+from openpyxl import load_workbook
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app import db
+from models import Employee, User
+import stats
+
+logger = logging.getLogger(__name__)
+
+# Spreadsheet header -> Employee attribute
+COLUMN_MAP = {
+    'Full Name': 'full_name',
+    'Joining Date': 'joining_date',
+    'Benzyl': 'benzyl',
+    'Role': 'role',
+    'Skill': 'skill',
+    'Team': 'team',
+    'Grade': 'grade',
+    'Designation': 'designation',
+    'Location': 'location',
+}
+
+# Accepted text formats for "Joining Date", tried in order
+DATE_FORMATS = ['%d-%m-%Y', '%Y-%m-%d', '%Y-%m-%d %H:%M:%S']
+
+# Rows written and committed per batch
+IMPORT_BATCH_SIZE = 1000
+
+# Rows read from an upload and validated at a time
+IMPORT_CHUNK_SIZE = 10000
+
+# Attributes refreshed when an employee with the same benzyl already exists.
+# The manager of an existing employee is never changed by an import.
+UPDATE_COLUMNS = [name for name in COLUMN_MAP.values() if name != 'benzyl']
+
+
+def parse_dates(column):
+    """Parse a "Joining Date" column into dates, NaT where it cannot be parsed"""
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column.dt.normalize()
+
+    text = column.astype('string').str.strip()
+    parsed = pd.Series(pd.NaT, index=column.index, dtype='datetime64[ns]')
+    for date_format in DATE_FORMATS:
+        missing = parsed.isna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(text[missing], format=date_format, errors='coerce')
+    return parsed
+
+
+def prepare_frame(df, first_row=2):
+    """Validate and normalise an uploaded frame.
+
+    Returns ``(frame, errors)`` where ``frame`` holds only importable rows with
+    Employee attribute names as columns plus ``manager_name``, and ``errors``
+    is a list of ``{'row': ..., 'error': ...}`` using spreadsheet row numbers
+    (``first_row`` is the number of the first data row).
+    """
+    missing_columns = [column for column in COLUMN_MAP if column not in df.columns]
+    if missing_columns:
+        raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+
+    frame = pd.DataFrame(index=df.index)
+    for header, attribute in COLUMN_MAP.items():
+        if attribute == 'joining_date':
+            continue
+        frame[attribute] = df[header].astype('string').str.strip()
+    frame['joining_date'] = parse_dates(df['Joining Date'])
+    if 'Manager Name' in df.columns:
+        frame['manager_name'] = df['Manager Name'].astype('string').str.strip().str.lower()
+    else:
+        frame['manager_name'] = pd.Series(pd.NA, index=df.index, dtype='string')
+
+    row_numbers = pd.Series(range(first_row, first_row + len(df)), index=df.index)
+    reasons = pd.Series('', index=df.index, dtype='object')
+
+    for header, attribute in COLUMN_MAP.items():
+        if attribute == 'joining_date':
+            empty = df[header].isna()
+        else:
+            empty = frame[attribute].isna() | frame[attribute].eq('').fillna(False)
+        reasons[empty] += f"missing {header}; "
+
+    bad_dates = frame['joining_date'].isna() & df['Joining Date'].notna()
+    reasons[bad_dates] += "unrecognised Joining Date; "
+
+    # The last occurrence of a benzyl wins, as it would if rows were applied in order
+    duplicated = frame['benzyl'].notna() & frame.duplicated('benzyl', keep='last')
+    reasons[duplicated] += "duplicate Benzyl, superseded by a later row; "
+
+    invalid = reasons.ne('')
+    errors = [{'row': int(row), 'error': reason.rstrip('; ')}
+              for row, reason in zip(row_numbers[invalid], reasons[invalid])]
+
+    frame = frame[~invalid].copy()
+    frame['joining_date'] = frame['joining_date'].dt.date
+    frame['_row'] = row_numbers[~invalid]
+    return frame, errors
+
+
+def _upsert_statement(dialect_name):
+    """INSERT ... ON CONFLICT (benzyl) DO UPDATE, or None if unsupported"""
+    if dialect_name == 'postgresql':
+        insert = postgresql.insert
+    elif dialect_name == 'sqlite':
+        insert = sqlite.insert
+    else:
+        return None
+
+    statement = insert(Employee)
+    return statement.on_conflict_do_update(
+        index_elements=[Employee.benzyl],
+        set_={column: statement.excluded[column] for column in UPDATE_COLUMNS + ['updated_at']}
+    )
+
+
+def _counter_deltas(records, existing):
+    """Dashboard counter changes for a batch; the bulk statements bypass the session"""
+    deltas = {}
+    managers = set()
+    for record in records:
+        if record['benzyl'] in existing:
+            # Updates keep the manager, but the skill may change
+            _, manager_id, old_skill = existing[record['benzyl']]
+            stats.add_deltas(deltas, stats.employee_contributions(manager_id, old_skill), sign=-1)
+            stats.add_deltas(deltas, stats.employee_contributions(manager_id, record['skill']))
+        else:
+            manager_id = record['manager_id']
+            stats.add_deltas(deltas, stats.employee_contributions(manager_id, record['skill']))
+        managers.add(manager_id)
+    stats.add_version_bumps(deltas, managers, employees=True)
+    return deltas
+
+
+def _write_batch(records, existing, upsert):
+    if upsert is not None:
+        db.session.execute(upsert, records)
+        return
+
+    # Generic fallback: bulk INSERT the new rows and bulk UPDATE by primary key
+    new_rows = [record for record in records if record['benzyl'] not in existing]
+    changed_rows = [dict({column: record[column] for column in UPDATE_COLUMNS + ['updated_at']},
+                         id=existing[record['benzyl']][0])
+                    for record in records if record['benzyl'] in existing]
+    if new_rows:
+        db.session.execute(db.insert(Employee), new_rows)
+    if changed_rows:
+        db.session.execute(update(Employee), changed_rows)
+
+
+def _cell_value(value):
+    # pandas.read_excel turns whole-number floats into ints; do the same
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _iter_xlsx_chunks(source, chunksize):
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(name).strip() if name is not None else f'Unnamed: {i}' for i, name in enumerate(header)]
+
+        chunk = []
+        blank = []
+        for row in rows:
+            # Blank rows keep their place (and row numbers) unless they trail the sheet
+            if all(value is None for value in row):
+                blank.append([None] * len(header))
+                continue
+            chunk.extend(blank)
+            blank = []
+            chunk.append([_cell_value(value) for value in row[:len(header)]])
+            if len(chunk) >= chunksize:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def iter_upload_chunks(source, filename, chunksize=IMPORT_CHUNK_SIZE):
+    """Yield an uploaded spreadsheet as DataFrames of at most chunksize rows.
+
+    ``source`` is a path or binary file object and ``filename`` decides the
+    format. Legacy .xls files cannot be streamed and are read whole.
+    """
+    if filename.lower().endswith('.csv'):
+        # Read every column as text so chunks do not infer different dtypes
+        with pd.read_csv(source, chunksize=chunksize, dtype=str) as reader:
+            yield from reader
+    elif filename.lower().endswith('.xlsx'):
+        yield from _iter_xlsx_chunks(source, chunksize)
+    else:
+        df = pd.read_excel(source)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+
+def manager_lookup():
+    """Manager username -> user id, for resolving the "Manager Name" column"""
+    return dict(db.session.execute(
+        select(User.username, User.id).where(User.is_manager.is_(True))
+    ).all())
+
+
+def import_upload(source, filename, default_manager_id, chunksize=IMPORT_CHUNK_SIZE, progress=None):
+    """Import an uploaded spreadsheet chunk by chunk.
+
+    Returns the same report as ``import_employees`` for the whole file.
+    ``progress``, if given, is called with the number of rows read and the
+    report so far after each chunk. Duplicate benzyls are only reported
+    within a chunk; across chunks the later row simply updates the earlier.
+    """
+    report = {'inserted': 0, 'updated': 0, 'errors': []}
+    managers = manager_lookup()
+    rows_read = 0
+    for chunk in iter_upload_chunks(source, filename, chunksize):
+        chunk_report = import_employees(chunk, default_manager_id, first_row=2 + rows_read, managers=managers)
+        rows_read += len(chunk)
+        report['inserted'] += chunk_report['inserted']
+        report['updated'] += chunk_report['updated']
+        report['errors'].extend(chunk_report['errors'])
+        if progress is not None:
+            progress(rows_read, report)
+    return report
+
+
+def import_employees(df, default_manager_id, batch_size=IMPORT_BATCH_SIZE, first_row=2, managers=None):
+    """Import employees from a DataFrame of spreadsheet rows.
+
+    Returns a report dict with ``inserted``, ``updated`` and ``errors``.
+    Batches that fail are rolled back and reported row by row; batches
+    already committed are kept. ``managers`` is a prefetched
+    ``manager_lookup()``.
+    """
+    frame, errors = prepare_frame(df, first_row=first_row)
+    report = {'inserted': 0, 'updated': 0, 'errors': errors}
+    if frame.empty:
+        return report
+
+    if managers is None:
+        # One lookup for every manager the file can refer to
+        managers = manager_lookup()
+    frame['manager_id'] = frame['manager_name'].map(managers)
+    frame['manager_id'] = frame['manager_id'].astype('object').where(frame['manager_id'].notna(),
+                                                                     default_manager_id)
+
+    upsert = _upsert_statement(db.engine.dialect.name)
+    columns = list(COLUMN_MAP.values()) + ['manager_id']
+
+    for start in range(0, len(frame), batch_size):
+        batch = frame.iloc[start:start + batch_size]
+        benzyls = batch['benzyl'].tolist()
+        records = batch[columns].astype('object').where(batch[columns].notna(), None)\
+            .to_dict('records')
+        updated_at = datetime.utcnow()
+        for record in records:
+            record['manager_id'] = int(record['manager_id'])
+            record['updated_at'] = updated_at
+
+        try:
+            existing = {benzyl: (employee_id, manager_id, skill)
+                        for benzyl, employee_id, manager_id, skill in db.session.execute(
+                            select(Employee.benzyl, Employee.id, Employee.manager_id, Employee.skill)
+                            .where(Employee.benzyl.in_(benzyls))
+                        )}
+            _write_batch(records, existing, upsert)
+            stats.apply_deltas(db.session.connection(), _counter_deltas(records, existing))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception(f"Error importing rows {batch['_row'].iloc[0]}-{batch['_row'].iloc[-1]}")
+            # The database error stays in the log; it can include SQL and constraint names
+            report['errors'].extend({'row': int(row),
+                                     'error': 'could not be saved; no rows in this batch were imported'}
+                                    for row in batch['_row'])
+            continue
+
+        report['updated'] += len(existing)
+        report['inserted'] += len(records) - len(existing)
+
+    report['errors'].sort(key=lambda error: error['row'])
+    return report
@@ -0,0 +1,186 @@
+"""
+Background jobs.
+
+Long-running work (imports, exports, documentation builds) is recorded as a
+Job row and executed by a small thread pool inside the worker process, so
+the request that submitted it returns immediately. Job state lives in the
+application database (SQLite by default), which lets any worker answer
+status polls, and finished artifacts are written under the instance folder
+for download.
+"""
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Lock
+from flask import Blueprint, current_app, jsonify, render_template, send_file, abort
+from flask_login import login_required, current_user
+from app import db
+from models import Job
+
+logger = logging.getLogger(__name__)
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+# Registered job handlers, keyed by Job.kind
+JOB_HANDLERS = {}
+
+_executor = None
+_executor_lock = Lock()
+
+
+def job_handler(kind):
+    """Register a function as the handler for a job kind.
+
+    The handler is called as ``handler(job, payload)`` inside an application
+    context and returns a dict that may contain ``result`` (JSON-serialisable
+    summary) and ``path``/``name``/``mimetype`` for a downloadable artifact.
+    """
+    def decorator(f):
+        JOB_HANDLERS[kind] = f
+        return f
+    return decorator
+
+
+def results_dir():
+    """Folder holding job uploads and artifacts"""
+    path = current_app.config.get('JOB_RESULTS_DIR') or \
+        os.path.join(current_app.instance_path, 'job_results')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def result_path(job_id, suffix):
+    return os.path.join(results_dir(), f"{job_id}{suffix}")
+
+
+def _get_executor():
+    # Created lazily so each (possibly forked) worker process gets its own threads
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('JOB_WORKERS', 2),
+                thread_name_prefix='ems-job'
+            )
+        return _executor
+
+
+def set_progress(job_id, message):
+    """Record a progress message for a running job"""
+    db.session.query(Job).filter_by(id=job_id).update({'progress': message})
+    db.session.commit()
+
+
+def submit_job(kind, payload=None, job_id=None):
+    """Record a job and schedule it on the worker pool; returns the Job"""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    expire_jobs()
+
+    job = Job(
+        id=job_id or uuid.uuid4().hex,
+        kind=kind,
+        status='queued',
+        payload=json.dumps(payload or {}),
+        created_by_id=current_user.id
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    _get_executor().submit(_run_job, app, job.id)
+    logger.info(f"Submitted job {job.kind} {job.id}")
+    return job
+
+
+def _run_job(app, job_id):
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        if job is None:
+            return
+
+        job.status = 'running'
+        job.started_at = datetime.utcnow()
+        db.session.commit()
+
+        try:
+            outcome = JOB_HANDLERS[job.kind](job, json.loads(job.payload or '{}')) or {}
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Job {job.kind} {job_id} failed")
+            job = db.session.get(Job, job_id)
+            job.status = 'failed'
+            job.error = str(e)
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            return
+
+        job = db.session.get(Job, job_id)
+        job.status = 'succeeded'
+        job.progress = None
+        job.finished_at = datetime.utcnow()
+        if 'result' in outcome:
+            job.result = json.dumps(outcome['result'], default=str)
+        if outcome.get('path'):
+            job.result_path = outcome['path']
+            job.result_name = outcome.get('name') or os.path.basename(outcome['path'])
+            job.result_mimetype = outcome.get('mimetype')
+        db.session.commit()
+        logger.info(f"Job {job.kind} {job_id} finished")
+
+
+def expire_jobs():
+    """Fail jobs stuck past the timeout and delete artifacts past their TTL"""
+    now = datetime.utcnow()
+    timeout = timedelta(seconds=current_app.config.get('JOB_TIMEOUT', 3600))
+    ttl = timedelta(seconds=current_app.config.get('JOB_RESULT_TTL', 86400))
+
+    # Jobs whose worker process went away never finish on their own
+    Job.query.filter(Job.status.in_(['queued', 'running']), Job.created_at < now - timeout)\
+        .update({'status': 'failed', 'error': 'Job timed out or its worker stopped',
+                 'finished_at': now}, synchronize_session=False)
+
+    for job in Job.query.filter(Job.result_path.isnot(None), Job.finished_at < now - ttl).all():
+        try:
+            os.remove(job.result_path)
+        except FileNotFoundError:
+            pass
+        job.result_path = None
+    db.session.commit()
+
+
+def _get_own_job(job_id):
+    job = db.get_or_404(Job, job_id)
+    if job.created_by_id != current_user.id:
+        abort(404)
+    return job
+
+
+@jobs_bp.route('/<job_id>')
+@login_required
+def job_status(job_id):
+    """Status page that polls until the job finishes"""
+    job = _get_own_job(job_id)
+    result = json.loads(job.result) if job.result else None
+    return render_template('job_status.html', job=job, result=result)
+
+
+@jobs_bp.route('/<job_id>/status')
+@login_required
+def job_status_json(job_id):
+    """Polling endpoint for a job's state"""
+    return jsonify(_get_own_job(job_id).to_dict())
+
+
+@jobs_bp.route('/<job_id>/download')
+@login_required
+def job_download(job_id):
+    """Download a finished job's artifact"""
+    job = _get_own_job(job_id)
+    if job.status != 'succeeded' or not job.result_path or not os.path.exists(job.result_path):
+        abort(404)
+    return send_file(job.result_path, as_attachment=True,
+                     download_name=job.result_name, mimetype=job.result_mimetype)
@@ -0,0 +1,209 @@
+"""
+Per-request profiling.
+
+For every request this records the wall time, time spent rendering
+templates, the number of SQL statements with their total time, and the
+slowest statements. Totals are aggregated per endpoint in process memory and
+exposed in Prometheus text format at ``/metrics`` (managers only). Requests
+slower than ``SLOW_REQUEST_THRESHOLD_MS`` are logged with their slowest
+statements.
+
+Each worker process keeps its own totals, so scrape every worker (or run a
+single worker) when collecting them.
+"""
+import heapq
+import logging
+import time
+from threading import Lock
+from flask import (Blueprint, Response, g, has_request_context, request,
+                   request_started, request_finished, before_render_template, template_rendered)
+from flask_login import login_required
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from utils import require_manager
+
+logger = logging.getLogger(__name__)
+metrics_bp = Blueprint('metrics', __name__)
+
+# Upper bounds (seconds) of the request duration histogram buckets
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Slowest statements kept per request for the slow-request log
+SLOWEST_STATEMENTS = 5
+
+
+class EndpointStats:
+    """Running totals for one endpoint"""
+
+    def __init__(self):
+        self.requests = {}  # (method, status) -> count
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.duration_sum = 0.0
+        self.duration_count = 0
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+
+
+_stats = {}
+_stats_lock = Lock()
+
+
+class RequestProfile:
+    """Measurements for the request being handled"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.slowest = []  # min-heap of (duration, statement)
+        self.template_time = 0.0
+        self.template_started = None
+
+    def add_statement(self, statement, duration):
+        self.sql_count += 1
+        self.sql_time += duration
+        entry = (duration, statement)
+        if len(self.slowest) < SLOWEST_STATEMENTS:
+            heapq.heappush(self.slowest, entry)
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+
+def current_profile():
+    """The profile of the current request, or None outside a request"""
+    if has_request_context():
+        return g.get('_request_profile')
+    return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['_query_started'].pop()
+    profile = current_profile()
+    if profile is not None:
+        profile.add_statement(statement, time.perf_counter() - started)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    # after_cursor_execute is not called for failed statements
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('_query_started'):
+        connection.info['_query_started'].pop()
+
+
+def _request_started(sender, **extra):
+    g._request_profile = RequestProfile()
+
+
+def _before_render_template(sender, template, context, **extra):
+    profile = current_profile()
+    if profile is not None:
+        profile.template_started = time.perf_counter()
+
+
+def _template_rendered(sender, template, context, **extra):
+    profile = current_profile()
+    if profile is not None and profile.template_started is not None:
+        profile.template_time += time.perf_counter() - profile.template_started
+        profile.template_started = None
+
+
+def _request_finished(sender, response, **extra):
+    profile = current_profile()
+    if profile is None:
+        return
+    duration = time.perf_counter() - profile.started
+    endpoint = request.endpoint or 'unknown'
+
+    with _stats_lock:
+        stats = _stats.setdefault(endpoint, EndpointStats())
+        key = (request.method, response.status_code)
+        stats.requests[key] = stats.requests.get(key, 0) + 1
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                stats.buckets[i] += 1
+        stats.duration_sum += duration
+        stats.duration_count += 1
+        stats.sql_count += profile.sql_count
+        stats.sql_time += profile.sql_time
+        stats.template_time += profile.template_time
+
+    threshold = sender.config.get('SLOW_REQUEST_THRESHOLD_MS')
+    if threshold and duration * 1000 >= threshold:
+        slowest = '\n'.join(f"  {d * 1000:.1f} ms: {' '.join(s.split())[:300]}"
+                            for d, s in sorted(profile.slowest, reverse=True))
+        logger.warning(
+            f"Slow request {request.method} {request.path} ({endpoint}): "
+            f"{duration * 1000:.1f} ms total, {profile.template_time * 1000:.1f} ms templates, "
+            f"{profile.sql_count} SQL statements in {profile.sql_time * 1000:.1f} ms"
+            + (f"\nSlowest statements:\n{slowest}" if slowest else "")
+        )
+
+
+def init_app(app):
+    """Start profiling requests of the given app"""
+    request_started.connect(_request_started, app)
+    request_finished.connect(_request_finished, app)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+    app.register_blueprint(metrics_bp)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus():
+    """All endpoint totals in Prometheus text exposition format"""
+    with _stats_lock:
+        snapshot = {endpoint: (dict(stats.requests), list(stats.buckets), stats.duration_sum,
+                               stats.duration_count, stats.sql_count, stats.sql_time, stats.template_time)
+                    for endpoint, stats in _stats.items()}
+
+    lines = [
+        '# HELP ems_http_requests_total Requests handled, by endpoint, method and status.',
+        '# TYPE ems_http_requests_total counter',
+    ]
+    for endpoint, (requests, *_) in sorted(snapshot.items()):
+        for (method, status), count in sorted(requests.items()):
+            lines.append(f'ems_http_requests_total{{endpoint="{_escape(endpoint)}",'
+                         f'method="{method}",status="{status}"}} {count}')
+
+    lines += [
+        '# HELP ems_http_request_duration_seconds Wall time of requests, by endpoint.',
+        '# TYPE ems_http_request_duration_seconds histogram',
+    ]
+    for endpoint, (_, buckets, duration_sum, duration_count, *_) in sorted(snapshot.items()):
+        label = f'endpoint="{_escape(endpoint)}"'
+        for bound, count in zip(DURATION_BUCKETS, buckets):
+            lines.append(f'ems_http_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+        lines.append(f'ems_http_request_duration_seconds_bucket{{{label},le="+Inf"}} {duration_count}')
+        lines.append(f'ems_http_request_duration_seconds_sum{{{label}}} {duration_sum:.6f}')
+        lines.append(f'ems_http_request_duration_seconds_count{{{label}}} {duration_count}')
+
+    totals = [
+        ('ems_sql_statements_total', 'SQL statements executed while handling requests.', 4, '{}'),
+        ('ems_sql_duration_seconds_total', 'Time spent executing SQL while handling requests.', 5, '{:.6f}'),
+        ('ems_template_render_seconds_total', 'Time spent rendering templates.', 6, '{:.6f}'),
+    ]
+    for name, help_text, index, value_format in totals:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for endpoint, values in sorted(snapshot.items()):
+            lines.append(f'{name}{{endpoint="{_escape(endpoint)}"}} {value_format.format(values[index])}')
+
+    return '\n'.join(lines) + '\n'
+
+
+@metrics_bp.route('/metrics')
+@login_required
+@require_manager
+def metrics():
+    """Request and SQL timing totals in Prometheus text format"""
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
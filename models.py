@@ -1,5 +1,7 @@
 from datetime import datetime
 from app import db
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -30,6 +32,11 @@ class User(UserMixin, db.Model):
 class Employee(db.Model):
     """Employee model to store employee details"""
     __tablename__ = 'employees'
+    __table_args__ = (
+        # Team lookups filter on manager_id; the dashboard also groups by skill
+        db.Index('ix_employees_manager_id_skill', 'manager_id', 'skill'),
+        db.Index('ix_employees_user_id', 'user_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     full_name = db.Column(db.String(100), nullable=False)
@@ -49,6 +56,16 @@ class Employee(db.Model):
     # Manager relationship
     manager_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     
+    # Version stamp for conditional GET; NULL for rows not changed since it was added
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Summary of the feedback received, kept up to date by stats.refresh_feedback_summaries;
+    # NULL feedback_count marks rows not summarized yet
+    feedback_count = db.Column(db.Integer, nullable=True, default=0)
+    average_rating = db.Column(db.Float, nullable=True)
+    last_rating = db.Column(db.Integer, nullable=True)
+    last_feedback_month = db.Column(db.String(7), nullable=True)
+    
     # Relationships
     feedback_received = db.relationship('Feedback', backref='employee', lazy='dynamic',
                                         foreign_keys='Feedback.employee_id')
@@ -60,6 +77,15 @@ class Employee(db.Model):
 class Feedback(db.Model):
     """Feedback model to store manager feedback for employees"""
     __tablename__ = 'feedback'
+    __table_args__ = (
+        # Feedback is always listed newest first per employee or per provider
+        db.Index('ix_feedback_employee_id_feedback_date', 'employee_id', 'feedback_date'),
+        db.Index('ix_feedback_provided_by_id_feedback_date', 'provided_by_id', 'feedback_date'),
+        # One entry per employee, month and provider; a unique index rather than a
+        # table constraint so that create_missing_indexes can add it to existing databases
+        db.Index('uq_feedback_employee_id_month_provided_by_id', 'employee_id', 'month', 'provided_by_id',
+                 unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('employees.id'), nullable=False)
@@ -70,6 +96,7 @@ class Feedback(db.Model):
     feedback_text = db.Column(db.Text, nullable=False)
     feedback_date = db.Column(db.DateTime, default=datetime.utcnow)
     month = db.Column(db.String(7), nullable=False)  # e.g., "2023-01"
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def __init__(self, **kwargs):
         super(Feedback, self).__init__(**kwargs)
@@ -78,3 +105,129 @@ class Feedback(db.Model):
     
     def __repr__(self):
         return f'<Feedback for Employee #{self.employee_id} by {self.provided_by.username}>'
+
+
+
+class Job(db.Model):
+    """Background job submitted from a request and run by the in-process job pool"""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_created_by_id_created_at', 'created_by_id', 'created_at'),
+    )
+    
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    payload = db.Column(db.Text, nullable=True)  # JSON arguments for the job handler
+    
+    created_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    progress = db.Column(db.String(200), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)  # JSON summary shown on the status page
+    result_path = db.Column(db.String(500), nullable=True)  # downloadable artifact, if any
+    result_name = db.Column(db.String(200), nullable=True)
+    result_mimetype = db.Column(db.String(100), nullable=True)
+    
+    @property
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'has_download': bool(self.result_path),
+        }
+    
+    def __repr__(self):
+        return f'<Job {self.kind} {self.id} {self.status}>'
+
+
+
+class StatCounter(db.Model):
+    """Precomputed dashboard counter, maintained incrementally by stats.py"""
+    __tablename__ = 'stat_counters'
+    __table_args__ = (
+        db.UniqueConstraint('manager_id', 'metric', 'bucket', name='uq_stat_counters_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Manager the counter belongs to; 0 holds the organisation-wide counters
+    manager_id = db.Column(db.Integer, nullable=False, default=0)
+    # headcount, skill, feedback_count, rating_sum or version
+    metric = db.Column(db.String(30), nullable=False)
+    # Skill name, feedback month ("YYYY-MM") or versioned page group; empty for headcount
+    bucket = db.Column(db.String(100), nullable=False, default='')
+    value = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<StatCounter {self.manager_id} {self.metric} {self.bucket}={self.value}>'
+
+
+def add_missing_columns():
+    """Add nullable columns declared after their table was created.
+
+    ``db.create_all()`` never alters existing tables. Only nullable columns
+    can be added this way; their client-side defaults apply to new rows.
+    """
+    inspector = inspect(db.engine)
+    added = []
+    with db.engine.begin() as connection:
+        preparer = connection.dialect.identifier_preparer
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                connection.execute(text(
+                    f"ALTER TABLE {preparer.quote(table.name)} ADD COLUMN {preparer.quote(column.name)} "
+                    f"{column.type.compile(dialect=connection.dialect)}"
+                ))
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def create_missing_indexes():
+    """Create any declared index that does not exist yet.
+
+    ``db.create_all()`` only creates indexes together with new tables, so
+    databases created before an index was declared need this to catch up.
+    Works for both SQLite and PostgreSQL.
+    """
+    inspector = inspect(db.engine)
+    created = []
+    failed = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            # create_all has not run yet; it creates the table with its indexes
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(db.engine)
+            except IntegrityError:
+                # Existing rows break a unique index; the other indexes are
+                # still created before giving up
+                failed.append(f"{index.name} ({table.name} has duplicate "
+                              f"{', '.join(column.name for column in index.columns)} rows)")
+                continue
+            created.append(index.name)
+    if failed:
+        raise RuntimeError(f"Could not create unique indexes: {'; '.join(failed)}. "
+                           f"Run `flask --app main merge-duplicate-feedback` to keep the newest "
+                           f"feedback per employee, month and provider, then init-db again.")
+    return created
@@ -0,0 +1,92 @@
+"""
+Authorization rules as SQL predicates.
+
+Who may see or change what is decided by the database, inside the query
+that loads the rows, rather than by loading ids into Python and checking
+them with further queries:
+
+* list views filter their query with a rule (``query.filter(rule)``)
+* single-row views load the row and the rule's verdict with one SELECT
+  through ``authorize()``, which still tells a missing row (404) apart from
+  one the user may not see
+
+The rules apply to the logged-in user:
+
+====================  ==========================================================
+visible_employees()   managers see every employee, employees their own record
+feedback_subjects()   whether the user may read one employee's feedback: their
+                      own, or for managers anyone below them at any depth
+direct_reports()      employees the manager gives feedback to
+listed_feedback()     the feedback list: a manager's direct reports' feedback,
+                      an employee's own
+own_feedback()        feedback the manager provided, which they may change
+====================  ==========================================================
+
+The Employee rules are turned into Feedback rules with ``feedback_for()``,
+an ``IN`` subquery that the feedback indexes on ``employee_id`` serve.
+"""
+from flask import abort
+from flask_login import current_user
+from sqlalchemy import false, or_, select, true
+from app import db
+from models import Employee, Feedback
+from hierarchy import manages_condition
+
+
+def visible_employees():
+    """Employee rule: who the user may look up"""
+    if current_user.is_manager:
+        return true()
+    return Employee.user_id == current_user.id
+
+
+def feedback_subjects(employee_id):
+    """Employee rule: whether the user may read the given employee's feedback.
+
+    Managers are checked by walking up from that employee instead of down
+    their whole subtree.
+    """
+    own = Employee.user_id == current_user.id
+    if not current_user.is_manager:
+        return own
+    return or_(own, manages_condition(current_user.id, employee_id))
+
+
+def direct_reports():
+    """Employee rule: who the user gives feedback to"""
+    if not current_user.is_manager:
+        return false()
+    return Employee.manager_id == current_user.id
+
+
+def feedback_for(employee_rule):
+    """Feedback rule: feedback about the employees an Employee rule allows"""
+    return Feedback.employee_id.in_(select(Employee.id).where(employee_rule))
+
+
+def listed_feedback():
+    """Feedback rule: what the feedback list and feedback search show"""
+    if current_user.is_manager:
+        return feedback_for(direct_reports())
+    return feedback_for(Employee.user_id == current_user.id)
+
+
+def own_feedback():
+    """Feedback rule: what the user may edit and delete"""
+    if not current_user.is_manager:
+        return false()
+    return Feedback.provided_by_id == current_user.id
+
+
+def authorize(model, ident, rule, *options):
+    """Load a row by primary key together with whether the rule allows it.
+
+    Returns ``(row, allowed)`` from a single SELECT and aborts with 404 when
+    there is no such row.
+    """
+    result = db.session.execute(
+        select(model, rule.label('allowed')).where(model.id == ident).options(*options)
+    ).first()
+    if result is None:
+        abort(404)
+    return result[0], bool(result.allowed)
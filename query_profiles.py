@@ -0,0 +1,36 @@
+"""
+Named eager-loading profiles.
+
+Templates that list feedback touch ``fb.employee`` and ``fb.provided_by`` for
+every row; without eager loading each access is a separate lazy SELECT.
+Views pick a profile by name so the relationships a template needs are
+loaded up front with a fixed number of queries, whatever the row count.
+"""
+from sqlalchemy.orm import selectinload
+from models import Feedback
+
+
+def _feedback_with_people():
+    # Lists across several employees: one SELECT ... IN for the employees
+    # and one for the providers
+    return (selectinload(Feedback.employee), selectinload(Feedback.provided_by))
+
+
+def _feedback_history():
+    # One employee's history: the employee is already known to the view
+    return (selectinload(Feedback.provided_by),)
+
+
+LOAD_PROFILES = {
+    'feedback_with_people': _feedback_with_people,
+    'feedback_history': _feedback_history,
+}
+
+
+def with_profile(query, name):
+    """Apply the loader options of a named profile to a query"""
+    try:
+        options = LOAD_PROFILES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown load profile: {name}") from None
+    return query.options(*options)
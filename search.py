@@ -0,0 +1,272 @@
+"""
+Full-text search over employees and feedback.
+
+* SQLite: FTS5 external-content tables ``employee_search`` and
+  ``feedback_search``, kept in sync by triggers on the base tables (so bulk
+  statements such as the importer's upserts are indexed too) and ranked with
+  ``bm25()``.
+* PostgreSQL: GIN expression indexes on ``to_tsvector('simple', ...)``,
+  ranked with ``ts_rank()``. Nothing needs to be kept in sync.
+* Other databases, or SQLite builds without FTS5, fall back to unranked
+  case-insensitive substring matching.
+
+Results follow the rules of the employee list and feedback pages: managers
+see every employee but only the feedback of their direct reports; other
+users see only their own employee record and the feedback they received.
+"""
+import logging
+import re
+from flask import Blueprint, render_template, request
+from flask_login import login_required, current_user
+from markupsafe import Markup, escape
+from sqlalchemy import and_, column, func, literal_column, or_, select, table, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import selectinload
+from app import db
+from models import Employee, Feedback
+from permissions import visible_employees, listed_feedback
+from utils import int_arg
+
+logger = logging.getLogger(__name__)
+search_bp = Blueprint('search', __name__)
+
+# Indexed columns per searchable table
+EMPLOYEE_SEARCH_COLUMNS = ['full_name', 'role', 'skill', 'team', 'designation', 'location']
+FEEDBACK_SEARCH_COLUMNS = ['feedback_text']
+
+SEARCH_PAGE_SIZE = 20
+
+# Words of feedback text shown around the matches
+SNIPPET_WORDS = 16
+
+# Placeholders for highlighted matches, replaced after the snippet is escaped
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+# (search table, content table, columns) for SQLite FTS5
+_FTS5_TABLES = [
+    ('employee_search', 'employees', EMPLOYEE_SEARCH_COLUMNS),
+    ('feedback_search', 'feedback', FEEDBACK_SEARCH_COLUMNS),
+]
+
+# One of 'fts5', 'tsvector' or 'like' once ensure_search_index() has run
+_backend = None
+
+
+def _fts5_triggers(name, content, columns):
+    names = ', '.join(columns)
+    new_values = ', '.join(f'new.{c}' for c in columns)
+    old_values = ', '.join(f'old.{c}' for c in columns)
+    insert_new = f"INSERT INTO {name}(rowid, {names}) VALUES (new.id, {new_values});"
+    delete_old = f"INSERT INTO {name}({name}, rowid, {names}) VALUES ('delete', old.id, {old_values});"
+    return {
+        f'{name}_ai': f"CREATE TRIGGER {name}_ai AFTER INSERT ON {content} BEGIN {insert_new} END",
+        f'{name}_ad': f"CREATE TRIGGER {name}_ad AFTER DELETE ON {content} BEGIN {delete_old} END",
+        f'{name}_au': f"CREATE TRIGGER {name}_au AFTER UPDATE OF {names} ON {content} "
+                      f"BEGIN {delete_old} {insert_new} END",
+    }
+
+
+def _tsvector_sql(columns, prefix=''):
+    # Queries must repeat the indexed expression exactly for the index to be used
+    document = " || ' ' || ".join(f"coalesce({prefix}{c}, '')" for c in columns)
+    return f"to_tsvector('simple'::regconfig, {document})"
+
+
+# index name -> (table, columns) for PostgreSQL
+_TSVECTOR_INDEXES = {
+    'ix_employees_search': ('employees', EMPLOYEE_SEARCH_COLUMNS),
+    'ix_feedback_search': ('feedback', FEEDBACK_SEARCH_COLUMNS),
+}
+
+
+def _ensure_fts5(connection):
+    existing = {name for (name,) in connection.execute(
+        text("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')"))}
+    for name, content, columns in _FTS5_TABLES:
+        stale = name not in existing
+        if stale:
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE {name} USING fts5({', '.join(columns)}, "
+                f"content='{content}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"))
+        for trigger, ddl in _fts5_triggers(name, content, columns).items():
+            if trigger not in existing:
+                # Rows written while a trigger was missing are not indexed
+                stale = True
+                connection.execute(text(ddl))
+        if stale:
+            connection.execute(text(f"INSERT INTO {name}({name}) VALUES ('rebuild')"))
+            logger.info(f"Built search index {name}")
+
+
+def ensure_search_index():
+    """Create the search tables, triggers or indexes this database needs"""
+    global _backend
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        try:
+            with db.engine.begin() as connection:
+                _ensure_fts5(connection)
+            _backend = 'fts5'
+        except OperationalError as e:
+            logger.warning(f"SQLite FTS5 is not available, search falls back to substring matching: {str(e)}")
+            _backend = 'like'
+    elif dialect == 'postgresql':
+        with db.engine.begin() as connection:
+            for name, (table_name, columns) in _TSVECTOR_INDEXES.items():
+                connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table_name} "
+                                        f"USING gin (({_tsvector_sql(columns)}))"))
+        _backend = 'tsvector'
+    else:
+        _backend = 'like'
+    return _backend
+
+
+def rebuild_search_index():
+    """Re-index every row, e.g. after rows were changed with triggers disabled"""
+    backend = ensure_search_index()
+    with db.engine.begin() as connection:
+        if backend == 'fts5':
+            for name, _, _ in _FTS5_TABLES:
+                connection.execute(text(f"INSERT INTO {name}({name}) VALUES ('rebuild')"))
+        elif backend == 'tsvector':
+            for name in _TSVECTOR_INDEXES:
+                connection.execute(text(f"REINDEX INDEX {name}"))
+    return backend
+
+
+def search_backend():
+    return _backend or ensure_search_index()
+
+
+def search_terms(q):
+    """Words of a search string; punctuation and search operators are ignored"""
+    return re.findall(r'\w+', q or '')
+
+
+def _fts5_query(terms):
+    # Every term must match, each as a quoted prefix
+    return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+
+def _like_filter(model, columns, terms):
+    return and_(*[or_(*[func.lower(getattr(model, c)).contains(term.lower(), autoescape=True) for c in columns])
+                  for term in terms])
+
+
+def _highlight(snippet):
+    """Escape a snippet and turn the match placeholders into <mark> tags"""
+    if snippet is None:
+        return None
+    return Markup(str(escape(snippet)).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>'))
+
+
+def _employee_query(terms):
+    backend = search_backend()
+    if backend == 'fts5':
+        fts = table('employee_search', column('rowid'))
+        rank = func.bm25(literal_column('employee_search'))
+        return select(Employee, rank.label('rank'))\
+            .join(fts, fts.c.rowid == Employee.id)\
+            .where(literal_column('employee_search').op('MATCH')(_fts5_query(terms))), rank
+    if backend == 'tsvector':
+        document = literal_column(_tsvector_sql(EMPLOYEE_SEARCH_COLUMNS, 'employees.'))
+        query = func.websearch_to_tsquery('simple', ' '.join(terms))
+        rank = func.ts_rank(document, query)
+        return select(Employee, rank.label('rank')).where(document.op('@@')(query)), rank.desc()
+    return select(Employee, literal_column('0').label('rank'))\
+        .where(_like_filter(Employee, EMPLOYEE_SEARCH_COLUMNS, terms)), None
+
+
+def _feedback_query(terms):
+    backend = search_backend()
+    if backend == 'fts5':
+        fts = table('feedback_search', column('rowid'))
+        rank = func.bm25(literal_column('feedback_search'))
+        snippet = func.snippet(literal_column('feedback_search'), 0, _MARK_START, _MARK_END, '…', SNIPPET_WORDS)
+        return select(Feedback, Employee, snippet.label('snippet'))\
+            .join(Employee, Feedback.employee_id == Employee.id)\
+            .join(fts, fts.c.rowid == Feedback.id)\
+            .where(literal_column('feedback_search').op('MATCH')(_fts5_query(terms))), rank
+    if backend == 'tsvector':
+        document = literal_column(_tsvector_sql(FEEDBACK_SEARCH_COLUMNS, 'feedback.'))
+        query = func.websearch_to_tsquery('simple', ' '.join(terms))
+        snippet = func.ts_headline('simple', Feedback.feedback_text, query,
+                                   f'StartSel="{_MARK_START}", StopSel="{_MARK_END}", '
+                                   f'MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}')
+        return select(Feedback, Employee, snippet.label('snippet'))\
+            .join(Employee, Feedback.employee_id == Employee.id)\
+            .where(document.op('@@')(query)), func.ts_rank(document, query).desc()
+    return select(Feedback, Employee, literal_column('NULL').label('snippet'))\
+        .join(Employee, Feedback.employee_id == Employee.id)\
+        .where(_like_filter(Feedback, FEEDBACK_SEARCH_COLUMNS, terms)), None
+
+
+def _paginate(query, order, tiebreak, page, per_page):
+    total = db.session.execute(select(func.count()).select_from(query.order_by(None).subquery())).scalar()
+    if per_page <= 0:
+        return [], total
+    ordering = [order, tiebreak] if order is not None else [tiebreak]
+    rows = db.session.execute(query.order_by(*ordering).offset((page - 1) * per_page).limit(per_page)).all()
+    return rows, total
+
+
+def search_employees(q, page=1, per_page=SEARCH_PAGE_SIZE):
+    """Employees visible to the current user matching q, best match first.
+
+    Returns ``(employees, total)``.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return [], 0
+    query, order = _employee_query(terms)
+    rows, total = _paginate(query.where(visible_employees()), order, Employee.id, page, per_page)
+    return [row[0] for row in rows], total
+
+
+def search_feedback(q, page=1, per_page=SEARCH_PAGE_SIZE):
+    """Feedback visible to the current user whose text matches q, best match first.
+
+    Returns ``(results, total)`` where each result is a dict with
+    ``feedback``, ``employee`` and a highlighted ``snippet`` (or None).
+    """
+    terms = search_terms(q)
+    if not terms:
+        return [], 0
+    query, order = _feedback_query(terms)
+    query = query.where(listed_feedback()).options(selectinload(Feedback.provided_by))
+    rows, total = _paginate(query, order, Feedback.id.desc(), page, per_page)
+    return [{'feedback': feedback, 'employee': employee, 'snippet': _highlight(snippet)}
+            for feedback, employee, snippet in rows], total
+
+
+SEARCH_SCOPES = {
+    'employees': search_employees,
+    'feedback': search_feedback,
+}
+
+
+@search_bp.route('/search')
+@login_required
+def search():
+    q = request.args.get('q', '').strip()
+    scope = request.args.get('scope')
+    if scope not in SEARCH_SCOPES:
+        scope = 'employees'
+    page = max(int_arg(request.args, 'page', 1), 1)
+
+    results, total = SEARCH_SCOPES[scope](q, page=page)
+    # Only the count is needed for the other tab
+    totals = {scope: total}
+    for other, search_function in SEARCH_SCOPES.items():
+        if other != scope:
+            totals[other] = search_function(q, per_page=0)[1]
+
+    return render_template('search.html',
+                           q=q,
+                           scope=scope,
+                           results=results,
+                           totals=totals,
+                           page=page,
+                           pages=max((total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE, 1),
+                           is_manager=current_user.is_manager)
@@ -9,8 +9,12 @@ import inspect
 import importlib
 from datetime import datetime
 from xhtml2pdf import pisa
+from doc_cache import build_if_changed
 import ast
 
+# Source files whose content the documentation is generated from
+DOCUMENTED_FILES = ['models.py', 'auth.py', 'employee.py', 'feedback.py', 'utils.py']
+
 def safe_import(module_name):
     """Try to import a module safely without crashing on circular imports"""
     try:
@@ -369,7 +373,24 @@ def create_pdf(html_content, output_path):
     else:
         return f"PDF documentation created successfully at {output_path}"
 
+def create_cached_pdf(output_path):
+    """Generate the PDF only if a documented module or this script changed"""
+    def build(path):
+        result = create_pdf(generate_html_documentation(), path)
+        if result.startswith("Error"):
+            raise RuntimeError(result)
+    
+    inputs = DOCUMENTED_FILES + [os.path.abspath(__file__)]
+    try:
+        rebuilt = build_if_changed(output_path, inputs, build)
+    except RuntimeError as e:
+        return str(e)
+    
+    if rebuilt:
+        return f"PDF documentation created successfully at {output_path}"
+    else:
+        return f"PDF documentation is up to date at {output_path}"
+
 if __name__ == "__main__":
-    html_content = generate_html_documentation()
-    result = create_pdf(html_content, "EMS_Functionality_Documentation.pdf")
+    result = create_cached_pdf("EMS_Functionality_Documentation.pdf")
     print(result)
\ No newline at end of file
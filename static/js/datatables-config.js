@@ -2,7 +2,30 @@ document.addEventListener('DOMContentLoaded', function() {
     // Initialize DataTables for employee list
     const employeeTable = document.getElementById('employeeTable');
     if (employeeTable) {
+        // Rows are paged, sorted and filtered on the server
+        const columns = Array.from(employeeTable.querySelectorAll('thead th')).map(th => {
+            const name = th.getAttribute('data-column');
+            if (name === 'actions') {
+                return { data: name, orderable: false, searchable: false };
+            }
+            return { data: name, render: DataTable.render.text() };
+        });
+
+        const emptyTemplate = document.getElementById('employeeTableEmpty');
+
         new DataTable('#employeeTable', {
+            processing: true,
+            serverSide: true,
+            // One request once typing pauses, not one per keystroke
+            searchDelay: 400,
+            ajax: employeeTable.getAttribute('data-source'),
+            columns: columns,
+            deferRender: true,
+            createdRow: function(row, data) {
+                if (data.is_team_member) {
+                    row.classList.add('table-primary');
+                }
+            },
             responsive: true,
             dom: '<"row"<"col-md-6"l><"col-md-6"f>>rt<"row"<"col-md-6"i><"col-md-6"p>>B',
             buttons: [
@@ -15,13 +38,21 @@ document.addEventListener('DOMContentLoaded', function() {
                 lengthMenu: "Show _MENU_ employees per page",
                 info: "Showing _START_ to _END_ of _TOTAL_ employees",
                 infoEmpty: "Showing 0 to 0 of 0 employees",
-                infoFiltered: "(filtered from _MAX_ total employees)"
+                infoFiltered: "(filtered from _MAX_ total employees)",
+                emptyTable: emptyTemplate ? emptyTemplate.innerHTML : "No employees found",
+                zeroRecords: "No matching employees found"
             },
             initComplete: function() {
-                // Connect the global search with DataTables search
+                // Connect the global search with DataTables search, waiting
+                // for a pause in typing like the table's own filter box
                 const dataTable = this;
+                let searchTimer = null;
                 $('#searchInput').on('keyup', function() {
-                    dataTable.api().search($(this).val()).draw();
+                    const value = $(this).val();
+                    clearTimeout(searchTimer);
+                    searchTimer = setTimeout(function() {
+                        dataTable.api().search(value).draw();
+                    }, 400);
                 });
             }
         });
@@ -30,17 +61,18 @@ document.addEventListener('DOMContentLoaded', function() {
     // Initialize DataTables for feedback list
     const feedbackTable = document.getElementById('feedbackTable');
     if (feedbackTable) {
-        new DataTable('#feedbackTable', {
+        // Rows come from the server newest first, a page at a time, so the
+        // table neither re-sorts nor pages them itself
+        const feedbackDataTable = new DataTable('#feedbackTable', {
             responsive: true,
             dom: '<"row"<"col-md-6"l><"col-md-6"f>>rt<"row"<"col-md-6"i><"col-md-6"p>>',
-            order: [[3, 'desc']], // Sort by date by default
-            pageLength: 10,
+            paging: false,
+            ordering: false,
             language: {
                 search: "Filter:",
-                lengthMenu: "Show _MENU_ feedback entries per page",
-                info: "Showing _START_ to _END_ of _TOTAL_ feedback entries",
-                infoEmpty: "Showing 0 to 0 of 0 feedback entries",
-                infoFiltered: "(filtered from _MAX_ total feedback entries)"
+                info: "Showing _TOTAL_ loaded feedback entries",
+                infoEmpty: "Showing 0 feedback entries",
+                infoFiltered: "(filtered from _MAX_ loaded feedback entries)"
             },
             initComplete: function() {
                 // Connect the global search with DataTables search
@@ -50,6 +82,36 @@ document.addEventListener('DOMContentLoaded', function() {
                 });
             }
         });
+
+        // "Load more" appends the next page after the last row loaded
+        const loadMoreFeedback = document.getElementById('loadMoreFeedback');
+        if (loadMoreFeedback) {
+            loadMoreFeedback.addEventListener('click', function() {
+                const url = new URL(loadMoreFeedback.getAttribute('data-url'), window.location.href);
+                url.searchParams.set('after', loadMoreFeedback.getAttribute('data-next'));
+                loadMoreFeedback.disabled = true;
+                fetch(url, {credentials: 'same-origin'})
+                    .then(response => {
+                        if (!response.ok) {
+                            throw new Error(response.statusText);
+                        }
+                        return response.json();
+                    })
+                    .then(page => {
+                        feedbackDataTable.rows.add($(page.html).filter('tr')).draw(false);
+                        if (page.next) {
+                            loadMoreFeedback.setAttribute('data-next', page.next);
+                            loadMoreFeedback.disabled = false;
+                        } else {
+                            loadMoreFeedback.parentElement.remove();
+                        }
+                    })
+                    .catch(error => {
+                        console.error('Could not load more feedback', error);
+                        loadMoreFeedback.disabled = false;
+                    });
+            });
+        }
     }
 
     // For dashboard stats, initialize simple charts
@@ -98,26 +160,27 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    // Feedback trends chart (for managers)
+    // Feedback rating trend, fetched from the analytics API
     const feedbackTrendsChart = document.getElementById('feedbackTrendsChart');
     if (feedbackTrendsChart) {
-        // Extract data from the page (this would be populated by the backend)
-        const quarters = [];
-        const avgRatings = [];
-        
-        document.querySelectorAll('.feedback-trend').forEach(trend => {
-            quarters.push(trend.getAttribute('data-quarter'));
-            avgRatings.push(parseFloat(trend.getAttribute('data-avg-rating')));
-        });
-        
-        // Create chart
-        new Chart(feedbackTrendsChart, {
-            type: 'line',
-            data: {
-                labels: quarters,
-                datasets: [{
+        fetch(feedbackTrendsChart.getAttribute('data-url'), {credentials: 'same-origin'})
+            .then(response => response.ok ? response.json() : Promise.reject(response.status))
+            .then(trend => {
+                // The team endpoint returns its totals under "overall"
+                const series = trend.overall || trend;
+                if (!trend.months.length) {
+                    feedbackTrendsChart.parentElement.innerHTML = '<p class="text-center mb-0">No feedback yet.</p>';
+                    return;
+                }
+                
+                const slope = document.getElementById('feedbackTrendSlope');
+                if (slope && series.slope !== null) {
+                    slope.textContent = (series.slope >= 0 ? '+' : '') + series.slope.toFixed(2) + ' per month';
+                }
+                
+                const datasets = [{
                     label: 'Average Rating',
-                    data: avgRatings,
+                    data: series.average,
                     lineTension: 0.3,
                     backgroundColor: "rgba(78, 115, 223, 0.05)",
                     borderColor: "rgba(78, 115, 223, 1)",
@@ -125,35 +188,72 @@ document.addEventListener('DOMContentLoaded', function() {
                     pointBackgroundColor: "rgba(78, 115, 223, 1)",
                     pointBorderColor: "rgba(78, 115, 223, 1)",
                     pointHoverRadius: 5,
-                    pointHoverBackgroundColor: "rgba(78, 115, 223, 1)",
-                    pointHoverBorderColor: "rgba(78, 115, 223, 1)",
                     pointHitRadius: 10,
                     pointBorderWidth: 2,
+                    spanGaps: true,
                     fill: true
-                }]
-            },
-            options: {
-                responsive: true,
-                maintainAspectRatio: false,
-                scales: {
-                    y: {
-                        min: 0,
-                        max: 5,
-                        ticks: {
-                            stepSize: 1
-                        }
-                    }
-                },
-                plugins: {
-                    legend: {
-                        display: false
+                }, {
+                    label: 'Rolling Average',
+                    data: series.rolling_average,
+                    lineTension: 0.3,
+                    borderColor: "rgba(28, 200, 138, 1)",
+                    borderDash: [6, 4],
+                    pointRadius: 0,
+                    spanGaps: true,
+                    fill: false
+                }];
+                if (series.p25) {
+                    datasets.push({
+                        label: '25th-75th Percentile',
+                        data: series.p75,
+                        borderColor: "rgba(133, 135, 150, 0.4)",
+                        backgroundColor: "rgba(133, 135, 150, 0.1)",
+                        pointRadius: 0,
+                        spanGaps: true,
+                        fill: '+1'
+                    }, {
+                        label: '25th Percentile',
+                        data: series.p25,
+                        borderColor: "rgba(133, 135, 150, 0.4)",
+                        pointRadius: 0,
+                        spanGaps: true,
+                        fill: false
+                    });
+                }
+                
+                new Chart(feedbackTrendsChart, {
+                    type: 'line',
+                    data: {
+                        labels: trend.months,
+                        datasets: datasets
                     },
-                    title: {
-                        display: true,
-                        text: 'Feedback Rating Trends by Quarter'
+                    options: {
+                        responsive: true,
+                        maintainAspectRatio: false,
+                        scales: {
+                            y: {
+                                min: 0,
+                                max: 5,
+                                ticks: {
+                                    stepSize: 1
+                                }
+                            }
+                        },
+                        plugins: {
+                            legend: {
+                                position: 'bottom',
+                                labels: {
+                                    filter: item => item.text !== '25th Percentile'
+                                }
+                            },
+                            title: {
+                                display: true,
+                                text: 'Average Rating by Month'
+                            }
+                        }
                     }
-                }
-            }
-        });
+                });
+            })
+            .catch(status => console.error('Could not load the rating trend', status));
     }
 });
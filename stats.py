@@ -0,0 +1,412 @@
+"""
+Materialized dashboard statistics.
+
+The dashboard used to count and group the employees and feedback tables on
+every page load. Instead, counters are kept in the ``stat_counters`` table
+per manager (and organisation-wide under manager 0) and adjusted whenever
+employees or feedback are flushed through the ORM session:
+
+* ``headcount``      employees managed
+* ``skill``          employees managed per skill (bucket = skill)
+* ``feedback_count`` feedback given per month (bucket = "YYYY-MM")
+* ``rating_sum``     sum of ratings given per month, for averages
+* ``version``        bumped on every change to the rows a group of pages shows
+                     (bucket = ``team`` per manager; ``employees`` and ``users``
+                     organisation-wide), for conditional GET (see http_cache)
+
+The feedback summary columns of each employee (count, average and last
+rating, last month) are recomputed in the same flush whenever their
+feedback changes, see ``refresh_feedback_summaries``.
+
+Bulk statements that bypass the session (the importer, team feedback,
+deleting an employee's feedback) apply their deltas through
+``apply_deltas`` directly.
+``rebuild()`` recomputes everything from scratch except the versions.
+"""
+import logging
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app import db
+from models import Employee, Feedback, StatCounter, User
+
+logger = logging.getLogger(__name__)
+
+# manager_id used for organisation-wide counters
+GLOBAL = 0
+
+
+def _manager_key(value):
+    # Form values arrive as strings; counters are keyed by integer ids
+    if value in (None, ''):
+        return None
+    return int(value)
+
+
+def employee_contributions(manager_id, skill):
+    """Counter increments contributed by one employee"""
+    manager_id = _manager_key(manager_id)
+    return [(manager_id, 'headcount', '', 1), (manager_id, 'skill', skill or '', 1)]
+
+
+def feedback_contributions(provided_by_id, month, rating):
+    """Counter increments contributed by one feedback entry"""
+    provided_by_id = _manager_key(provided_by_id)
+    return [(provided_by_id, 'feedback_count', month or '', 1),
+            (provided_by_id, 'rating_sum', month or '', int(rating or 0))]
+
+
+# Model -> (attributes the counters depend on, contribution function)
+TRACKED_MODELS = {
+    Employee: (('manager_id', 'skill'), employee_contributions),
+    Feedback: (('provided_by_id', 'month', 'rating'), feedback_contributions),
+}
+
+
+def add_version_bumps(deltas, manager_ids=(), employees=False, users=False):
+    """Bump the versions of the pages that show the changed rows"""
+    keys = [(manager_id, 'version', 'team') for manager_id in {_manager_key(m) for m in manager_ids}
+            if manager_id is not None]
+    if employees:
+        keys.append((GLOBAL, 'version', 'employees'))
+    if users:
+        keys.append((GLOBAL, 'version', 'users'))
+    for key in keys:
+        deltas[key] = deltas.get(key, 0) + 1
+
+
+def add_deltas(deltas, contributions, sign=1):
+    """Accumulate contributions into a {(manager_id, metric, bucket): delta} dict"""
+    for manager_id, metric, bucket, amount in contributions:
+        scopes = (GLOBAL,) if manager_id is None else (GLOBAL, manager_id)
+        for scope in scopes:
+            key = (scope, metric, bucket)
+            deltas[key] = deltas.get(key, 0) + sign * amount
+
+
+def _values(obj, attributes, previous=False):
+    """Current attribute values, or the values before this flush's changes"""
+    state = inspect(obj)
+    values = []
+    for attribute in attributes:
+        history = state.attrs[attribute].history
+        if previous and history.deleted:
+            values.append(history.deleted[0])
+        elif previous and history.added and not history.deleted:
+            # The attribute was unset before this change
+            values.append(None)
+        else:
+            values.append(getattr(obj, attribute))
+    return values
+
+
+def _has_changes(obj, attributes):
+    state = inspect(obj)
+    return any(state.attrs[attribute].history.has_changes() for attribute in attributes)
+
+
+def _track_versions(session, deltas):
+    managers = set()
+    feedback_employees = set()
+    changed_employees = changed_users = False
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, User):
+            changed_users = True
+        elif isinstance(obj, Employee):
+            changed_employees = True
+            managers.update(_values(obj, ['manager_id']) + _values(obj, ['manager_id'], previous=True))
+        elif isinstance(obj, Feedback):
+            managers.update(_values(obj, ['provided_by_id']) + _values(obj, ['provided_by_id'], previous=True))
+            feedback_employees.add(obj.employee_id)
+
+    # Feedback is listed to the employee's current manager too
+    feedback_employees.discard(None)
+    if feedback_employees:
+        managers.update(session.connection().execute(
+            select(Employee.manager_id).where(Employee.id.in_(feedback_employees))
+        ).scalars())
+
+    add_version_bumps(deltas, managers, employees=changed_employees, users=changed_users)
+
+
+@event.listens_for(Session, 'after_flush')
+def track_counter_changes(session, flush_context):
+    """Turn flushed employee and feedback changes into counter deltas"""
+    deltas = {}
+
+    for obj in session.new:
+        tracked = TRACKED_MODELS.get(type(obj))
+        if tracked:
+            attributes, contributions = tracked
+            add_deltas(deltas, contributions(*_values(obj, attributes)))
+
+    for obj in session.deleted:
+        tracked = TRACKED_MODELS.get(type(obj))
+        if tracked:
+            attributes, contributions = tracked
+            add_deltas(deltas, contributions(*_values(obj, attributes, previous=True)), sign=-1)
+
+    for obj in session.dirty:
+        tracked = TRACKED_MODELS.get(type(obj))
+        if tracked and _has_changes(obj, tracked[0]):
+            attributes, contributions = tracked
+            add_deltas(deltas, contributions(*_values(obj, attributes, previous=True)), sign=-1)
+            add_deltas(deltas, contributions(*_values(obj, attributes)))
+
+    _track_versions(session, deltas)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+    summarized = _summarized_employees(session)
+    if summarized:
+        refresh_feedback_summaries(session.connection(), summarized)
+
+
+# Feedback attributes the employee summaries depend on
+SUMMARY_ATTRIBUTES = ('employee_id', 'rating', 'month', 'feedback_date')
+
+
+def _summarized_employees(session):
+    employee_ids = set()
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        if not isinstance(obj, Feedback):
+            continue
+        if obj in session.dirty and not _has_changes(obj, SUMMARY_ATTRIBUTES):
+            continue
+        employee_ids.update(_values(obj, ['employee_id']) + _values(obj, ['employee_id'], previous=True))
+    employee_ids.discard(None)
+    return employee_ids
+
+
+def refresh_feedback_summaries(connection, employee_ids=None):
+    """Recompute the feedback summary columns of the given employees, or of all.
+
+    Runs within the caller's transaction; call it after bulk statements on
+    the feedback table, which do not go through the session's flush.
+    """
+    feedback = Feedback.__table__
+    employees = Employee.__table__
+    of_employee = feedback.c.employee_id == employees.c.id
+    statement = update(employees).values(
+        feedback_count=select(func.count(feedback.c.id)).where(of_employee).scalar_subquery(),
+        average_rating=select(func.avg(feedback.c.rating * 1.0)).where(of_employee).scalar_subquery(),
+        last_rating=select(feedback.c.rating).where(of_employee)
+            .order_by(feedback.c.feedback_date.desc(), feedback.c.id.desc()).limit(1).scalar_subquery(),
+        last_feedback_month=select(func.max(feedback.c.month)).where(of_employee).scalar_subquery(),
+        # A summary change is not an edit of the employee's record
+        updated_at=employees.c.updated_at,
+    )
+    if employee_ids is not None:
+        statement = statement.where(employees.c.id.in_(list(employee_ids)))
+    connection.execute(statement)
+
+
+def _upsert_statement(dialect_name):
+    if dialect_name == 'postgresql':
+        insert = postgresql.insert
+    elif dialect_name == 'sqlite':
+        insert = sqlite.insert
+    else:
+        return None
+
+    statement = insert(StatCounter)
+    return statement.on_conflict_do_update(
+        index_elements=[StatCounter.manager_id, StatCounter.metric, StatCounter.bucket],
+        set_={'value': StatCounter.value + statement.excluded.value}
+    )
+
+
+def apply_deltas(connection, deltas):
+    """Add deltas to the counters within the caller's transaction"""
+    rows = [{'manager_id': manager_id, 'metric': metric, 'bucket': bucket, 'value': delta}
+            for (manager_id, metric, bucket), delta in deltas.items() if delta]
+    if not rows:
+        return
+
+    upsert = _upsert_statement(connection.dialect.name)
+    if upsert is not None:
+        connection.execute(upsert, rows)
+        return
+
+    for row in rows:
+        result = connection.execute(
+            update(StatCounter)
+            .where(StatCounter.manager_id == row['manager_id'],
+                   StatCounter.metric == row['metric'],
+                   StatCounter.bucket == row['bucket'])
+            .values(value=StatCounter.value + row['value'])
+        )
+        if result.rowcount == 0:
+            connection.execute(db.insert(StatCounter), [row])
+
+
+def remove_employee_feedback(employee_id):
+    """Deltas for bulk-deleting all feedback of an employee.
+
+    Call before ``Feedback.query.filter_by(employee_id=...).delete()``, which
+    does not go through the session's flush.
+    """
+    deltas = {}
+    rows = db.session.execute(
+        select(Feedback.provided_by_id, Feedback.month, func.count(Feedback.id), func.sum(Feedback.rating))
+        .where(Feedback.employee_id == employee_id)
+        .group_by(Feedback.provided_by_id, Feedback.month)
+    ).all()
+    for provided_by_id, month, count, rating_sum in rows:
+        add_deltas(deltas, [(provided_by_id, 'feedback_count', month, count),
+                            (provided_by_id, 'rating_sum', month, rating_sum or 0)], sign=-1)
+    add_version_bumps(deltas, {provided_by_id for provided_by_id, *_ in rows})
+    apply_deltas(db.session.connection(), deltas)
+
+
+def add_inserted_feedback(rows):
+    """Counters, versions and summaries for bulk-inserted feedback.
+
+    ``rows`` are the inserted values (``employee_id``, ``provided_by_id``,
+    ``month``, ``rating``); call within the transaction of the INSERT, which
+    does not go through the session's flush.
+    """
+    if not rows:
+        return
+    deltas = {}
+    for row in rows:
+        add_deltas(deltas, feedback_contributions(row['provided_by_id'], row['month'], row['rating']))
+    employee_ids = {row['employee_id'] for row in rows}
+    # Feedback is listed to the employee's current manager too
+    managers = {row['provided_by_id'] for row in rows}
+    managers.update(db.session.execute(
+        select(Employee.manager_id).where(Employee.id.in_(employee_ids))
+    ).scalars())
+    add_version_bumps(deltas, managers)
+    connection = db.session.connection()
+    apply_deltas(connection, deltas)
+    refresh_feedback_summaries(connection, employee_ids)
+
+
+def merge_duplicate_feedback():
+    """Keep only the newest feedback per employee, month and provider.
+
+    For databases from before the ``uq_feedback_employee_id_month_provided_by_id``
+    index, which cannot be created while such duplicates exist. Counters,
+    page versions and employee summaries are updated in the same transaction.
+    Returns the number of feedback entries removed.
+    """
+    ranked = select(
+        Feedback.id, Feedback.employee_id, Feedback.provided_by_id, Feedback.month, Feedback.rating,
+        func.row_number().over(
+            partition_by=(Feedback.employee_id, Feedback.month, Feedback.provided_by_id),
+            order_by=(Feedback.feedback_date.desc(), Feedback.id.desc())
+        ).label('position')
+    ).subquery()
+    duplicates = db.session.execute(select(ranked).where(ranked.c.position > 1)).all()
+    if not duplicates:
+        return 0
+
+    deltas = {}
+    for row in duplicates:
+        add_deltas(deltas, feedback_contributions(row.provided_by_id, row.month, row.rating), sign=-1)
+    employee_ids = {row.employee_id for row in duplicates}
+    managers = {row.provided_by_id for row in duplicates}
+    managers.update(db.session.execute(
+        select(Employee.manager_id).where(Employee.id.in_(employee_ids))
+    ).scalars())
+    add_version_bumps(deltas, managers)
+
+    db.session.execute(db.delete(Feedback).where(Feedback.id.in_([row.id for row in duplicates])))
+    connection = db.session.connection()
+    apply_deltas(connection, deltas)
+    refresh_feedback_summaries(connection, employee_ids)
+    db.session.commit()
+    logger.info(f"Removed {len(duplicates)} duplicate feedback entries of {len(employee_ids)} employees")
+    return len(duplicates)
+
+
+def rebuild():
+    """Recompute every counter from the employees and feedback tables"""
+    deltas = {}
+    for manager_id, skill, count in db.session.execute(
+            select(Employee.manager_id, Employee.skill, func.count(Employee.id))
+            .group_by(Employee.manager_id, Employee.skill)):
+        add_deltas(deltas, [(manager_id, 'headcount', '', count), (manager_id, 'skill', skill, count)])
+
+    for provided_by_id, month, count, rating_sum in db.session.execute(
+            select(Feedback.provided_by_id, Feedback.month, func.count(Feedback.id), func.sum(Feedback.rating))
+            .group_by(Feedback.provided_by_id, Feedback.month)):
+        add_deltas(deltas, [(provided_by_id, 'feedback_count', month, count),
+                            (provided_by_id, 'rating_sum', month, rating_sum or 0)])
+
+    # Versions are kept: resetting them could make a stale page's ETag match again
+    db.session.execute(db.delete(StatCounter).where(StatCounter.metric != 'version'))
+    apply_deltas(db.session.connection(), deltas)
+    refresh_feedback_summaries(db.session.connection())
+    db.session.commit()
+    logger.info(f"Rebuilt {len(deltas)} dashboard counters and the employee feedback summaries")
+
+
+def ensure_initialized():
+    """Build the counters and summaries once for databases that predate them"""
+    has_counters = db.session.query(StatCounter.id).limit(1).first() is not None
+    has_data = db.session.query(Employee.id).limit(1).first() is not None or \
+        db.session.query(Feedback.id).limit(1).first() is not None
+    if has_data and not has_counters:
+        rebuild()
+    elif db.session.query(Employee.id).filter(Employee.feedback_count.is_(None)).limit(1).first() is not None:
+        # Employees from before the summary columns were added
+        refresh_feedback_summaries(db.session.connection())
+        db.session.commit()
+
+
+def page_versions(manager_id=None):
+    """(employees, users, team) versions; team is 0 without a manager_id"""
+    rows = db.session.execute(
+        select(StatCounter.manager_id, StatCounter.bucket, StatCounter.value)
+        .where(StatCounter.metric == 'version',
+               StatCounter.manager_id.in_([GLOBAL] if manager_id is None else [GLOBAL, manager_id]))
+    ).all()
+    versions = {(scope, bucket): value for scope, bucket, value in rows}
+    return (versions.get((GLOBAL, 'employees'), 0),
+            versions.get((GLOBAL, 'users'), 0),
+            versions.get((manager_id, 'team'), 0) if manager_id is not None else 0)
+
+
+def dashboard_counters(manager_id=None):
+    """Counters for the dashboard, read from the precomputed rows.
+
+    Returns total_employees and, when manager_id is given, managed_employees,
+    team_skills, feedback_given, average_rating and feedback_by_month.
+    """
+    scopes = [GLOBAL] if manager_id is None else [GLOBAL, manager_id]
+    rows = StatCounter.query.filter(StatCounter.manager_id.in_(scopes)).all()
+
+    counters = {
+        'total_employees': 0,
+        'managed_employees': 0,
+        'team_skills': [],
+        'feedback_given': 0,
+        'average_rating': None,
+        'feedback_by_month': {},
+    }
+    rating_sums = {}
+    for row in rows:
+        if row.manager_id == GLOBAL:
+            if row.metric == 'headcount':
+                counters['total_employees'] = row.value
+            continue
+
+        if row.metric == 'headcount':
+            counters['managed_employees'] = row.value
+        elif row.metric == 'skill' and row.value > 0:
+            counters['team_skills'].append((row.bucket, row.value))
+        elif row.metric == 'feedback_count' and row.value > 0:
+            counters['feedback_by_month'][row.bucket] = row.value
+        elif row.metric == 'rating_sum':
+            rating_sums[row.bucket] = row.value
+
+    counters['team_skills'].sort()
+    counters['feedback_given'] = sum(counters['feedback_by_month'].values())
+    if counters['feedback_given']:
+        total_rating = sum(rating_sums.get(month, 0) for month in counters['feedback_by_month'])
+        counters['average_rating'] = round(total_rating / counters['feedback_given'], 2)
+    return counters
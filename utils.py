@@ -1,9 +1,12 @@
 from functools import wraps
-from flask import flash, redirect, url_for, Response
+from flask import flash, redirect, url_for, Response, stream_with_context
 from flask_login import current_user
 from datetime import datetime
-import pandas as pd
+import csv
 import io
+import os
+import tempfile
+from app import db
 from models import Employee, User
 
 def require_manager(f):
@@ -20,45 +23,167 @@ def get_current_month():
     now = datetime.utcnow()
     return f"{now.year:04d}-{now.month:02d}"
 
+def recent_months(count=24):
+    """The last ``count`` months as "YYYY-MM", newest first"""
+    now = datetime.utcnow()
+    index = now.year * 12 + now.month - 1
+    return [f"{(index - i) // 12:04d}-{(index - i) % 12 + 1:02d}" for i in range(count)]
+
+def int_arg(args, name, default):
+    """Integer request argument, or the default when missing or not a number"""
+    try:
+        return int(args.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+def parse_datatables_args(args, columns, default_length=10, max_length=500):
+    """Parse DataTables server-side processing parameters from a request's args.
+
+    Only column names present in ``columns`` are accepted for sorting and
+    per-column filtering; anything else falls back to the first column.
+    """
+    column_names = list(columns)
+
+    # DataTables sends column definitions as columns[i][data]
+    requested = {}
+    index = 0
+    while f'columns[{index}][data]' in args:
+        requested[index] = args.get(f'columns[{index}][data]')
+        index += 1
+
+    column_search = {}
+    for i, name in requested.items():
+        value = (args.get(f'columns[{i}][search][value]') or '').strip()
+        if value and name in columns:
+            column_search[name] = value
+
+    order_column = requested.get(int_arg(args, 'order[0][column]', 0))
+    if order_column not in columns:
+        order_column = column_names[0]
+    order_dir = 'desc' if args.get('order[0][dir]') == 'desc' else 'asc'
+
+    # A length of -1 means "all rows" to DataTables; cap it like any other
+    length = int_arg(args, 'length', default_length)
+    if length <= 0 or length > max_length:
+        length = max_length
+
+    return {
+        'draw': int_arg(args, 'draw', 0),
+        'start': max(int_arg(args, 'start', 0), 0),
+        'length': length,
+        'search': (args.get('search[value]') or '').strip(),
+        'column_search': column_search,
+        'order_column': order_column,
+        'order_dir': order_dir,
+    }
+
+# Columns of the employee export, in order; also the headers the importer expects
+EXPORT_COLUMNS = [
+    'Full Name', 'Joining Date', 'Benzyl', 'Role', 'Skill', 'Team',
+    'Manager Name', 'Grade', 'Designation', 'Location'
+]
+
+# Rows fetched from the database per round trip while exporting
+EXPORT_BATCH_SIZE = 1000
+
+def iter_employee_export_rows(batch_size=EXPORT_BATCH_SIZE):
+    """Yield one tuple per employee in EXPORT_COLUMNS order.
+
+    Managers are resolved with a single outer join and rows are streamed from
+    the cursor in batches, so memory does not grow with the headcount.
+    """
+    query = db.session.query(
+        Employee.full_name,
+        Employee.joining_date,
+        Employee.benzyl,
+        Employee.role,
+        Employee.skill,
+        Employee.team,
+        User.username,
+        Employee.grade,
+        Employee.designation,
+        Employee.location
+    ).outerjoin(User, Employee.manager_id == User.id)\
+        .order_by(Employee.id)\
+        .execution_options(yield_per=batch_size)
+
+    for row in query:
+        row = tuple(row)
+        yield row[:6] + (row[6] or "",) + row[7:]
+
+def generate_employees_csv(batch_size=EXPORT_BATCH_SIZE):
+    """Generate the employee export as CSV text, one chunk per batch of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    for count, row in enumerate(iter_employee_export_rows(batch_size), start=1):
+        writer.writerow(row)
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+def export_employees_to_csv():
+    """Export employee data to CSV, streamed while it is being generated"""
+    return Response(
+        stream_with_context(generate_employees_csv()),
+        mimetype='text/csv',
+        headers={
+            'Content-Disposition': 'attachment; filename=employee_data.csv'
+        }
+    )
+
+def _stream_file(path, chunk_size=64 * 1024):
+    """Yield a file in chunks and remove it once it has been sent"""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+def write_employees_csv(path):
+    """Write the employee export as CSV to a file"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for chunk in generate_employees_csv():
+            f.write(chunk)
+
+def write_employees_xlsx(path):
+    """Write the employee export as an Excel workbook to a file.
+
+    openpyxl's write-only mode flushes rows to disk as they are appended, so
+    memory stays flat regardless of the number of rows.
+    """
+    from openpyxl import Workbook  # Only needed for exports; slow to import
+    
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Employees')
+    sheet.append(EXPORT_COLUMNS)
+    for row in iter_employee_export_rows():
+        sheet.append(row)
+    workbook.save(path)
+
 def export_employees_to_excel():
-    """Export employee data to Excel"""
-    # Query all employees
-    employees = Employee.query.all()
-
-    # Create dataframe
-    data = []
-    for employee in employees:
-        manager = User.query.get(employee.manager_id) if employee.manager_id else None
-        manager_name = manager.username if manager else ""
-
-        data.append({
-            'Full Name': employee.full_name,
-            'Joining Date': employee.joining_date,
-            'Benzyl': employee.benzyl,
-            'Role': employee.role,
-            'Skill': employee.skill,
-            'Team': employee.team,
-            'Manager Name': manager_name,
-            'Grade': employee.grade,
-            'Designation': employee.designation,
-            'Location': employee.location
-        })
-
-    # Convert to DataFrame
-    df = pd.DataFrame(data)
-
-    # Create Excel file in memory
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Employees')
-
-    output.seek(0)
-
-    # Create response with Excel file
+    """Export employee data to Excel, streamed from a temporary file"""
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        write_employees_xlsx(path)
+    except Exception:
+        os.remove(path)
+        raise
+
     return Response(
-        output,
+        _stream_file(path),
         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
         headers={
-            'Content-Disposition': 'attachment; filename=employee_data.xlsx'
+            'Content-Disposition': 'attachment; filename=employee_data.xlsx',
+            'Content-Length': str(os.path.getsize(path))
         }
-    )
\ No newline at end of file
+    )